@@ -5,9 +5,11 @@ Encodes information about C types, and provides functions to serialize types.
 The JSON that is output prioritizes compactness over readability.
 Note that all sizes are in 8-bit bytes
 """
+from bisect import bisect_left
 from collections import defaultdict
 from json import JSONEncoder, dumps, loads
 
+import functools
 import gzip
 import os
 import typing as t
@@ -17,6 +19,65 @@ try:
 except ImportError:
     print("Could not import ida_typeinf. Cannot parse IDA types.")
 
+# suffix of the instance attributes holding memoized values
+_MEMO = "_memo"
+
+
+def _memoized(method: t.Callable[[t.Any], t.Any]) -> t.Callable[[t.Any], t.Any]:
+    """Computes the result of a method without arguments once per instance.
+    Only for immutable classes, see _Immutable."""
+    key = f"_{method.__name__.strip('_')}{_MEMO}"
+
+    @functools.wraps(method)
+    def memoized(self: t.Any) -> t.Any:
+        try:
+            return self.__dict__[key]
+        except KeyError:
+            value = self.__dict__[key] = method(self)
+            return value
+
+    return memoized
+
+
+def _offsets_mask(offsets: t.Iterable[int], base: int = 0) -> int:
+    """Bitmask of a memory layout, bit i is set if base + i is in offsets"""
+    # set in bytes rather than in an int, which is copied by every |=
+    bits = bytearray()
+    for offset in offsets:
+        offset -= base
+        if offset >> 3 >= len(bits):
+            bits.extend(bytes((offset >> 3) + 1 - len(bits)))
+        bits[offset >> 3] |= 1 << (offset & 7)
+    return int.from_bytes(bits, "little")
+
+
+def _lowest_bit(mask: int) -> int:
+    return mask & -mask
+
+
+class _Immutable:
+    """Attributes are set once, when the object is built, and never changed.
+
+    Types are interned and shared (see TypeLibCodec.decode_dict), and their
+    strings, hashes, tokens and offsets are memoized on them.
+    """
+
+    def __setattr__(self, name: str, value: t.Any) -> None:
+        if name in self.__dict__:
+            raise AttributeError(f"{type(self).__name__}.{name} cannot be changed")
+        super().__setattr__(name, value)
+
+    def __getstate__(self) -> t.Dict[str, t.Any]:
+        # memoized values are computed again
+        return {
+            name: value
+            for name, value in self.__dict__.items()
+            if not name.endswith(_MEMO)
+        }
+
+    def __setstate__(self, state: t.Dict[str, t.Any]) -> None:
+        self.__dict__.update(state)
+
 
 class TypeLib:
     """A library of types.
@@ -290,55 +351,103 @@ class TypeLib:
             entries.sort()
 
     @staticmethod
-    def fix_bit(typ):
-        succeed = True
+    def fix_bit(typ: "Struct") -> t.Optional["Struct"]:
+        """typ with the sizes of its fields converted from bits to bytes, None
+        if a field is not made of whole bytes"""
+        layout: t.List[t.Union[UDT.Member, "Struct", "Union"]] = []
         for m in typ.layout:
             if isinstance(m, UDT.Field):
-                succeed &= m.size % 8 == 0
-                if not succeed:
-                    break
-                m.size //= 8
+                if m.size % 8 != 0:
+                    return None
+                m = UDT.Field(name=m.name, size=m.size // 8, type_name=m.type_name)
             elif isinstance(m, Struct):
-                succeed &= TypeLib.fix_bit(m)
-        typ.size = sum(m.size for m in typ.layout)
-        return succeed
+                m = TypeLib.fix_bit(m)
+                if m is None:
+                    return None
+            layout.append(m)
+        return Struct(name=typ.name, layout=layout)
 
     def fix(self):
-        """HACK: workaround to deal with the struct bit/bytes problem in the data."""
+        """HACK: workaround to deal with the struct bit/bytes problem in the data.
+
+        Types are immutable, so the fixed structs are new ones and this
+        TypeLib is left unchanged."""
         new_lib = TypeLib()
         for size in self.keys():
             for entry in self[size]:
-                succeed = True
                 if isinstance(entry.typeinfo, Struct):
-                    succeed &= TypeLib.fix_bit(entry.typeinfo)
-                    nsize = entry.typeinfo.size
+                    fixed = TypeLib.fix_bit(entry.typeinfo)
+                    if fixed is None:
+                        continue
+                    entry = TypeLib.Entry(frequency=entry.frequency, typeinfo=fixed)
+                    nsize = fixed.size
                 else:
                     nsize = size
-                if succeed:
-                    if nsize not in new_lib:
-                        new_lib.add_entry_list(nsize, TypeLib.EntryList())
-                    new_lib[nsize].add_entry(entry)
+                if nsize not in new_lib:
+                    new_lib.add_entry_list(nsize, TypeLib.EntryList())
+                new_lib[nsize].add_entry(entry)
         return new_lib
 
     def make_cached_replacement_dict(self):
+        """Index of the types by their layout, the bitmasks of their accessible
+        and start offsets"""
         self.cached_replacement_dict = defaultdict(set)
         for size in self.keys():
             if size > 1024: continue
             for entry in self[size]:
-                self.cached_replacement_dict[entry.typeinfo.accessible_offsets(), entry.typeinfo.start_offsets()].add(entry.typeinfo)
+                accessible, _, starts = entry.typeinfo.layout_masks()
+                self.cached_replacement_dict[accessible, starts].add(entry.typeinfo)
+
+    @staticmethod
+    def _layout_masks(
+        accessible: t.Sequence[int], start_offsets: t.Sequence[int]
+    ) -> t.Optional[t.Tuple[int, int]]:
+        """Bitmasks of a memory layout relative to its first accessible offset,
+        None if it is not the first start offset"""
+        if len(accessible) == 0 or len(start_offsets) == 0:
+            return None
+        start = accessible[0]
+        if start != start_offsets[0]:
+            return None
+        return _offsets_mask(accessible, start), _offsets_mask(start_offsets, start)
+
+    def _next_replacement_sizes(
+        self, accessible: int, starts: int
+    ) -> t.Iterator[t.Tuple[t.Set["TypeInfo"], int]]:
+        """get_next_replacements of a memory layout given as bitmasks relative
+        to its first accessible offset, which is also its first start offset.
+        Yields (types, size) where size is the number of bytes the types take."""
+        if not hasattr(self, 'cached_replacement_dict'):
+            self.make_cached_replacement_dict()
+        length = accessible.bit_length()
+        for size in self.keys():
+            if size > length or size == 0:
+                continue
+            # The remainder must either be empty or start with a type, i.e.,
+            # its first accessible offset is its first start offset.
+            if _lowest_bit(accessible >> size) != _lowest_bit(starts >> size):
+                continue
+            current = (1 << size) - 1
+            typs = self.cached_replacement_dict.get(
+                (accessible & current, starts & current), set()
+            )
+            yield typs, size
 
     def valid_layout_for_types(self, rest_a, rest_s, typs):
+        masks = self._layout_masks(rest_a, rest_s) if len(rest_a) != 0 else (0, 0)
         for typ in typs:
-            if len(rest_a) == 0:
+            if masks is None or masks[0] == 0:
                 return False
-            ret = self.get_next_replacements(rest_a, rest_s)
-            find = False
-            for typ_set, a, s in ret:
+            accessible, starts = masks
+            for typ_set, size in self._next_replacement_sizes(accessible, starts):
                 if typ in typ_set:
-                    rest_a, rest_s = a, s
-                    find = True
+                    accessible >>= size
+                    starts >>= size
+                    # relative to the first offset of the remainder
+                    shift = max(_lowest_bit(accessible).bit_length() - 1, 0)
+                    masks = accessible >> shift, starts >> shift
                     break
-            if not find:
+            else:
                 return False
         return True
 
@@ -363,41 +472,22 @@ class TypeLib:
 
         Notes:
         - The first start offset and accessible offset should be the same
+        - Both accessible and start_offsets are sorted
         - The list returned is sorted by decreasing frequency in the library
         """
-        if not hasattr(self, 'cached_replacement_dict'):
-            self.make_cached_replacement_dict()
-        start = accessible[0]
-        if start != start_offsets[0]:
+        masks = self._layout_masks(accessible, start_offsets)
+        if masks is None:
             # print("No replacements, start != first accessible")
             return []
-
-        # The last element of accessible is the last address in memory.
-        length = (accessible[-1] - start) + 1
+        start = accessible[0]
         replacements = []
-        # Filter out types that are too long or of size zero
-        for size in filter(lambda s: s <= length and s != 0, self.keys()):
-            # Compute the memory layout of the remainder
-            rest_accessible = tuple(s for s in accessible if s >= (size + start))
-            rest_start = tuple(s for s in start_offsets if s >= (size + start))
-            # If the remainder of the start offsets is not either an empty tuple
-            # or if the first element of the new start offsets is not the same
-            # as the first member of the new accessible, this is not a legal size.
-            if len(rest_start) != 0 and (len(rest_accessible) == 0 or rest_start[0] != rest_accessible[0]):
-                continue
-            # If there are no more start offsets, but there are still accessible
-            # offsets, this is not a legal replacement.
-            if len(rest_start) == 0 and len(rest_accessible) != 0:
-                continue
-            shifted_cur_accessible = tuple(s - start for s in accessible if s < (size + start))
-            shifted_cur_start = tuple(s - start for s in start_offsets if s < (size + start))
-            typs = self.cached_replacement_dict[shifted_cur_accessible, shifted_cur_start]
+        for typs, size in self._next_replacement_sizes(*masks):
+            # The memory layout of the remainder
+            end = start + size
+            rest_accessible = tuple(accessible[bisect_left(accessible, end):])
+            rest_start = tuple(start_offsets[bisect_left(start_offsets, end):])
             replacements.append((typs, rest_accessible, rest_start))
         return replacements
-        {
-            typ.typeinfo: (a, s)
-            for (typ, a, s) in replacements
-        }
 
     @staticmethod
     def accessible_of_types(types: t.Iterable["TypeInfo"]) -> t.List[int]:
@@ -522,13 +612,18 @@ class TypeLib:
         }
 
 
-class TypeInfo:
-    """Stores information about a type"""
+class TypeInfo(_Immutable):
+    """Stores information about a type.
+
+    TypeInfos are immutable, their string, hash, tokens and offsets are
+    computed once.
+    """
 
     def __init__(self, *, name: t.Optional[str], size: int):
         self.name = name
         self.size = size
 
+    @_memoized
     def accessible_offsets(self) -> t.Tuple[int, ...]:
         """Offsets accessible in this type"""
         return tuple(range(self.size))
@@ -541,26 +636,35 @@ class TypeInfo:
         """Start offsets of elements in this type"""
         return (0,)
 
+    @_memoized
+    def layout_masks(self) -> t.Tuple[int, int, int]:
+        """Bitmasks of the accessible, inaccessible and start offsets in this
+        type, bit i is set if offset i is in them"""
+        return (
+            _offsets_mask(self.accessible_offsets()),
+            _offsets_mask(self.inaccessible_offsets()),
+            _offsets_mask(self.start_offsets()),
+        )
+
     def replacable_with(self, others: t.Tuple["TypeInfo", ...]) -> bool:
         """Check if this type can be replaced with others"""
         if self.size != sum(other.size for other in others):
             return False
         cur_offset = 0
-        other_start: t.Tuple[int, ...] = tuple()
-        other_accessible: t.Tuple[int, ...] = tuple()
-        other_inaccessible: t.Tuple[int, ...] = tuple()
+        other_accessible = 0
+        other_inaccessible = 0
+        other_start = 0
         for other in others:
-
-            def displace(offsets: t.Tuple[int, ...]) -> t.Tuple[int, ...]:
-                return tuple(off + cur_offset for off in offsets)
-
-            other_start += displace(other.start_offsets())
-            other_accessible += displace(other.accessible_offsets())
-            other_inaccessible += displace(other.inaccessible_offsets())
+            accessible, inaccessible, starts = other.layout_masks()
+            other_accessible |= accessible << cur_offset
+            other_inaccessible |= inaccessible << cur_offset
+            other_start |= starts << cur_offset
+            cur_offset += other.size
+        accessible, inaccessible, starts = self.layout_masks()
         return (
-            set(self.start_offsets()).issubset(other_start)
-            and self.accessible_offsets() == other_accessible
-            and self.inaccessible_offsets() == other_inaccessible
+            starts & ~other_start == 0
+            and accessible == other_accessible
+            and inaccessible == other_inaccessible
         )
 
     @classmethod
@@ -582,8 +686,9 @@ class TypeInfo:
     def __str__(self) -> str:
         return f"{self.name}"
 
-    def tokenize(self) -> t.List[str]:
-        return [str(self), '<eot>']
+    @_memoized
+    def tokenize(self) -> t.Tuple[str, ...]:
+        return (str(self), '<eot>')
 
     @classmethod
     def detokenize(cls, subtypes: t.List[str]) -> t.List[str]:
@@ -633,6 +738,7 @@ class Array(TypeInfo):
         self.nelements = nelements
         self.size = element_size * nelements
 
+    @_memoized
     def start_offsets(self) -> t.Tuple[int, ...]:
         """Returns the start offsets elements in this array
 
@@ -661,16 +767,19 @@ class Array(TypeInfo):
             )
         return False
 
+    @_memoized
     def __hash__(self) -> int:
         return hash((self.nelements, self.element_size, self.element_type))
 
+    @_memoized
     def __str__(self) -> str:
         if self.nelements == 0:
             return f"{self.element_type}[]"
         return f"{self.element_type}[{self.nelements}]"
 
-    def tokenize(self) -> t.List[str]:
-        return ["<array>", f"{self.element_type}", f"[{self.nelements}]", "<eot>"]
+    @_memoized
+    def tokenize(self) -> t.Tuple[str, ...]:
+        return ("<array>", f"{self.element_type}", f"[{self.nelements}]", "<eot>")
 
 
 class Pointer(TypeInfo):
@@ -700,11 +809,13 @@ class Pointer(TypeInfo):
     def __hash__(self) -> int:
         return hash(self.target_type_name)
 
+    @_memoized
     def __str__(self) -> str:
         return f"{self.target_type_name} *"
 
-    def tokenize(self) -> t.List[str]:
-        return ["<ptr>", self.target_type_name, "<eot>"]
+    @_memoized
+    def tokenize(self) -> t.Tuple[str, ...]:
+        return ("<ptr>", self.target_type_name, "<eot>")
 
 class UDT(TypeInfo):
     """An object representing struct or union types"""
@@ -712,7 +823,7 @@ class UDT(TypeInfo):
     def __init__(self) -> None:
         raise NotImplementedError
 
-    class Member:
+    class Member(_Immutable):
         """A member of a UDT. Can be a Field or Padding"""
 
         size: int = 0
@@ -789,40 +900,39 @@ class Struct(UDT):
     ):
         self.name = name
         self.layout = tuple(layout)
-        self.size = 0
-        for l in layout:
-            self.size += l.size
+        self.size = sum(l.size for l in self.layout)
 
     def has_padding(self) -> bool:
         """True if the Struct has padding"""
         return any((isinstance(m, UDT.Padding) for m in self.layout))
 
+    @_memoized
     def accessible_offsets(self) -> t.Tuple[int, ...]:
         """Offsets accessible in this struct"""
-        accessible: t.Tuple[int, ...] = tuple()
+        accessible: t.List[int] = []
         current_offset = 0
         for m in self.layout:
             next_offset = current_offset + m.size
             if isinstance(m, UDT.Field):
-                for offset in range(current_offset, next_offset):
-                    accessible += (offset,)
+                accessible.extend(range(current_offset, next_offset))
             current_offset = next_offset
-        return accessible
+        return tuple(accessible)
 
+    @_memoized
     def inaccessible_offsets(self) -> t.Tuple[int, ...]:
         """Offsets inaccessible in this struct"""
         if not self.has_padding():
             return tuple()
-        inaccessible: t.Tuple[int, ...] = tuple()
+        inaccessible: t.List[int] = []
         current_offset = 0
         for m in self.layout:
             next_offset = current_offset + m.size
             if isinstance(m, UDT.Padding):
-                for offset in range(current_offset, next_offset):
-                    inaccessible += (offset,)
+                inaccessible.extend(range(current_offset, next_offset))
             current_offset = next_offset
-        return inaccessible
+        return tuple(inaccessible)
 
+    @_memoized
     def start_offsets(self) -> t.Tuple[int, ...]:
         """Returns the start offsets of fields in this struct
 
@@ -831,13 +941,13 @@ class Struct(UDT):
         [int, char, padding(3), long, long]
         has offsets [0, 4, 8, 16].
         """
-        starts: t.Tuple[int, ...] = tuple()
+        starts: t.List[int] = []
         current_offset = 0
         for m in self.layout:
             if isinstance(m, UDT.Field):
-                starts += (current_offset,)
+                starts.append(current_offset)
             current_offset += m.size
-        return starts
+        return tuple(starts)
 
     @classmethod
     def _from_json(cls, d: t.Dict[str, t.Any]) -> "Struct":
@@ -855,21 +965,21 @@ class Struct(UDT):
             return self.name == other.name and self.layout == other.layout
         return False
 
+    @_memoized
     def __hash__(self) -> int:
         return hash((self.name, self.layout))
 
+    @_memoized
     def __str__(self) -> str:
         if self.name is None:
             ret = f"struct {{ "
         else:
             ret = f"struct {self.name} {{ "
-        for l in self.layout:
-            ret += f"{str(l)}; "
-        ret += "}"
-        return ret
+        return ret + "".join(f"{str(l)}; " for l in self.layout) + "}"
 
-    def tokenize(self) -> t.List[str]:
-        return ["<struct>", self.name if self.name is not None else ""] + [str(l) for l in self.layout] + ["<eot>"]
+    @_memoized
+    def tokenize(self) -> t.Tuple[str, ...]:
+        return ("<struct>", self.name if self.name is not None else "") + tuple(str(l) for l in self.layout) + ("<eot>",)
 
 
 class Union(UDT):
@@ -886,21 +996,21 @@ class Union(UDT):
         self.members = tuple(members)
         self.padding = padding
         # Set size to 0 if there are no members
-        try:
-            self.size = max(m.size for m in members)
-        except ValueError:
-            self.size = 0
+        size = max((m.size for m in self.members), default=0)
         if self.padding is not None:
-            self.size += self.padding.size
+            size += self.padding.size
+        self.size = size
 
     def has_padding(self) -> bool:
         """Returns True if this Union has padding"""
         return self.padding is not None
 
+    @_memoized
     def accessible_offsets(self) -> t.Tuple[int, ...]:
         """Offsets accessible in this Union"""
         return tuple(range(max(m.size for m in self.members)))
 
+    @_memoized
     def inaccessible_offsets(self) -> t.Tuple[int, ...]:
         """Offsets inaccessible in this Union"""
         if not self.has_padding():
@@ -936,22 +1046,22 @@ class Union(UDT):
             )
         return False
 
+    @_memoized
     def __hash__(self) -> int:
         return hash((self.name, self.members, self.padding))
 
+    @_memoized
     def __str__(self) -> str:
         if self.name is None:
             ret = f"union {{ "
         else:
             ret = f"union {self.name} {{ "
-        for m in self.members:
-            ret += f"{str(m)}; "
+        ret += "".join(f"{str(m)}; " for m in self.members)
         if self.padding is not None:
             ret += f"{str(self.padding)}; "
-        ret += "}"
-        return ret
+        return ret + "}"
 
-    def tokenize(self) -> t.List[str]:
+    def tokenize(self) -> t.Tuple[str, ...]:
         raise NotImplementedError
         
 
@@ -1036,12 +1146,54 @@ class TypeLibCodec:
 
     CodecTypes = t.Union["TypeLib", "TypeLib.EntryList", "TypeInfo", "UDT.Member"]
 
+    # Interning table of decode_dict, keyed by the frozen JSON encoding.
+    # Cleared when it grows past MAX_INTERNED.
+    _interned: t.Dict[t.Tuple, "TypeLibCodec.CodecTypes"] = {}
+    MAX_INTERNED = 1 << 16
+
     @staticmethod
     def decode(encoded: str) -> CodecTypes:
         """Decodes a JSON string"""
 
         return loads(encoded, object_hook=TypeLibCodec.read_metadata)
 
+    @staticmethod
+    def decode_dict(d: t.Dict[str, t.Any]) -> CodecTypes:
+        """Decodes an already parsed JSON dict, e.g., the type of a variable in
+        a dataset record. Same as decode(dumps(d)) without the JSON round trip.
+
+        Types recur across variables and functions, so the decoded objects are
+        interned: equal encodings share one (immutable) instance.
+        """
+        key = TypeLibCodec._freeze(d)
+        decoded = TypeLibCodec._interned.get(key)
+        if decoded is None:
+            decoded = TypeLibCodec._decode_parsed(d)
+            if len(TypeLibCodec._interned) >= TypeLibCodec.MAX_INTERNED:
+                TypeLibCodec._interned.clear()
+            TypeLibCodec._interned[key] = decoded
+        return decoded
+
+    @staticmethod
+    def _freeze(o: t.Any) -> t.Any:
+        """Hashable form of parsed JSON"""
+        if isinstance(o, dict):
+            return tuple((k, TypeLibCodec._freeze(v)) for k, v in o.items())
+        if isinstance(o, list):
+            return ("[",) + tuple(TypeLibCodec._freeze(v) for v in o)
+        return o
+
+    @staticmethod
+    def _decode_parsed(o: t.Any) -> t.Any:
+        """Applies read_metadata bottom-up, like the object_hook of decode"""
+        if isinstance(o, dict):
+            return TypeLibCodec.read_metadata(
+                {k: TypeLibCodec._decode_parsed(v) for k, v in o.items()}
+            )
+        if isinstance(o, list):
+            return [TypeLibCodec._decode_parsed(v) for v in o]
+        return o
+
     @staticmethod
     def read_metadata(d: t.Dict[str, t.Any]) -> "TypeLibCodec.CodecTypes":
         classes: t.Dict[
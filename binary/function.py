@@ -1,7 +1,5 @@
 from collections import defaultdict
-
-from json import dumps
-from typing import DefaultDict, Mapping, Optional, Set, Tuple
+from typing import DefaultDict, Dict, Mapping, Optional, Set, Tuple, Union
 
 # Huge hack to get importing to work with the decompiler
 try:
@@ -17,6 +15,8 @@ except ImportError:
 class Function:
     """Holds information about a C function
 
+    ast: AST of the function, or its JSON encoding which is decoded on first
+        access of the ast property
     name: name of the function
     return_type: return type of the function
     arguments: list of arguments to the function
@@ -26,7 +26,7 @@ class Function:
     def __init__(
         self,
         *,
-        ast: Optional[AST] = None,
+        ast: Optional[Union[AST, Dict]] = None,
         name: str,
         return_type: TypeInfo,
         arguments: Mapping[Location, Set[Variable]],
@@ -41,7 +41,11 @@ class Function:
         self._raw_code = raw_code
 
     def to_json(self):
-        ast = self.ast.to_json() if self.ast else None
+        if isinstance(self._ast, dict):
+            # not decoded yet, no need to round-trip through the AST
+            ast = self._ast
+        else:
+            ast = self._ast.to_json() if self._ast else None
         arguments = dict()
         for key, args in self.arguments.items():
             arguments[key.json_key()] = [arg.to_json() for arg in args]
@@ -59,8 +63,10 @@ class Function:
 
     @classmethod
     def from_json(cls, d):
-        ast = AST.from_json(d["t"]) if d["t"] else None
-        return_type = TypeLibCodec.decode(dumps(d["r"]))
+        # Decoding the AST is expensive and most users only need the variables,
+        # so it is kept as JSON until the ast property is accessed
+        ast = d["t"] if d["t"] else None
+        return_type = TypeLibCodec.decode_dict(d["r"])
         arguments = dict()
         for key, args in d["a"].items():
             arguments[location_from_json_key(key)] = \
@@ -79,7 +85,9 @@ class Function:
         )
 
     @property
-    def ast(self) -> AST:
+    def ast(self) -> Optional[AST]:
+        if isinstance(self._ast, dict):
+            self._ast = AST.from_json(self._ast)
         return self._ast
 
     @property
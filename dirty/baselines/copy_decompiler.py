@@ -7,6 +7,8 @@ from utils.dataset import Dataset
 
 if __name__ == "__main__":
     config = json.loads(_jsonnet.evaluate_file("retype.xfmr.jsonnet"))
+    # only the decompiler output is used, skip decoding the ground truth
+    config["data"].setdefault("json_fields", Dataset.SOURCE_FIELDS)
     dataset = Dataset(config["data"]["test_file"], config["data"])
     dataloader = torch.utils.data.DataLoader(dataset, num_workers=8, batch_size=None)
     types_model = dataset.vocab.types
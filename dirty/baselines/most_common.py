@@ -5,15 +5,16 @@ import torch
 import wandb
 from tqdm import tqdm
 from utils.dataset import Dataset
-from utils.dire_types import TypeLibCodec
+from utils.registry import load_typelib
 
 
 if __name__ == "__main__":
     config = json.loads(_jsonnet.evaluate_file("retype.xfmr.jsonnet"))
+    # only the decompiler output is used, skip decoding the ground truth
+    config["data"].setdefault("json_fields", Dataset.SOURCE_FIELDS)
     dataset = Dataset(config["data"]["test_file"], config["data"])
     dataloader = torch.utils.data.DataLoader(dataset, num_workers=8, batch_size=None)
-    with open(config["data"]["typelib_file"]) as type_f:
-        typelib = TypeLibCodec.decode(type_f.read())
+    typelib = load_typelib(config["data"]["typelib_file"])
     most_common_for_size = {}
     types_model = dataset.vocab.types
     for size in typelib:
@@ -29,6 +29,7 @@ import torch
 import wandb
 from docopt import docopt
 from pytorch_lightning.loggers import WandbLogger
+from pytorch_lightning.callbacks import Callback
 from pytorch_lightning.callbacks.early_stopping import EarlyStopping
 from torch.utils.data import DataLoader
 
@@ -37,6 +38,33 @@ from utils import util
 from utils.dataset import Dataset
 
 
+class ResumableDataCallback(Callback):
+    """Saves a checkpoint every n training steps, including the reading
+    positions of the data loader workers, and drops the resume state of the
+    training set once the resumed epoch is over."""
+
+    def __init__(self, train_set: Dataset, name: str, every_n_steps: int = 0):
+        self.train_set = train_set
+        self.name = name
+        self.every_n_steps = every_n_steps
+        self.last_saved_step = 0
+
+    def on_batch_end(self, trainer, pl_module):
+        step = trainer.global_step
+        if (
+            self.every_n_steps
+            and step > self.last_saved_step
+            and step % self.every_n_steps == 0
+        ):
+            trainer.save_checkpoint(
+                os.path.join(trainer.default_root_dir, f"{self.name}-last.ckpt")
+            )
+            self.last_saved_step = step
+
+    def on_train_epoch_end(self, trainer, pl_module, *args):
+        self.train_set.resume_state = None
+
+
 def train(args):
     config = json.loads(_jsonnet.evaluate_file(args["CONFIG_FILE"]))
 
@@ -47,20 +75,33 @@ def train(args):
 
     # dataloaders
     batch_size = config["train"]["batch_size"]
+    # batch_size is either a number of examples or a token budget,
+    # e.g., {"max_tokens": 8192}, in which case the dataset yields whole batches
+    max_tokens = batch_size["max_tokens"] if isinstance(batch_size, dict) else None
+    # continue an interrupted epoch from where the data loader workers were
+    resume_state = None
+    if args["--resume"]:
+        resume_state = torch.load(args["--resume"], map_location="cpu").get(
+            "dataset_states"
+        )
     train_set = Dataset(
-        config["data"]["train_file"], config["data"], percent=float(args["--percent"])
+        config["data"]["train_file"],
+        config["data"],
+        percent=float(args["--percent"]),
+        max_tokens=max_tokens,
+        resume_state=resume_state,
     )
     dev_set = Dataset(config["data"]["dev_file"], config["data"])
     train_loader = DataLoader(
         train_set,
-        batch_size=batch_size,
+        batch_size=None if max_tokens else batch_size,
         collate_fn=Dataset.collate_fn,
         num_workers=16,
         pin_memory=True,
     )
     val_loader = DataLoader(
         dev_set,
-        batch_size=batch_size,
+        batch_size=config["test"]["batch_size"] if max_tokens else batch_size,
         collate_fn=Dataset.collate_fn,
         num_workers=8,
         pin_memory=True,
@@ -89,7 +130,12 @@ def train(args):
                 else "val_rename_acc",
                 mode="max",
                 patience=config["train"]["patience"],
-            )
+            ),
+            ResumableDataCallback(
+                train_set,
+                args["--expname"],
+                config["train"].get("checkpoint_every_n_steps", 0),
+            ),
         ],
         check_val_every_n_epoch=config["train"]["check_val_every_n_epoch"],
         progress_bar_refresh_rate=10,
@@ -98,9 +144,10 @@ def train(args):
         limit_test_batches=config["test"]["limit"] if "limit" in config["test"] else 1.0
     )
     if args["--eval-ckpt"]:
-        # HACK: necessary to make pl test work for IterableDataset
-        Dataset.__len__ = lambda self: 1000000
         test_set = Dataset(config["data"]["test_file"], config["data"])
+        if test_set.length is None:
+            # HACK: necessary to make pl test work for IterableDataset without shard indexes
+            test_set.length = 1000000
         test_loader = DataLoader(
             test_set,
             batch_size=config["test"]["batch_size"],
@@ -6,8 +6,8 @@ import pytorch_lightning as pl
 import torch
 import torch.nn.functional as F
 from pytorch_lightning.metrics.functional import accuracy
-from utils.vocab import Vocab
-from utils.dire_types import TypeInfo, TypeLibCodec
+from utils.registry import load_typelib, load_vocab
+from utils.dire_types import TypeInfo
 
 from model.encoder import Encoder
 from model.decoder import Decoder
@@ -262,21 +262,23 @@ class TypeReconstructionModel(pl.LightningModule):
             if self.rename:
                 self.renaming_module = RenamingDecodeModule(config)
         self.config = config
-        self.vocab = Vocab.load(config["data"]["vocab_file"])
+        self.vocab = load_vocab(config["data"]["vocab_file"])
         self._preprocess()
         self.soft_mem_mask = config["decoder"]["mem_mask"] == "soft"
+        # reading positions of the training data loader workers, by worker id
+        self.dataset_states = {}
+        self.resumed = False
 
     def _preprocess(self):
         self.vocab.types.struct_set = set()
         for idx, type_str in self.vocab.types.id2word.items():
             if type_str.startswith("struct"):
                 self.vocab.types.struct_set.add(idx)
-        with open(self.config["data"]["typelib_file"]) as type_f:
-            typelib = TypeLibCodec.decode(type_f.read())
-            self.typstr_to_piece = {}
-            for size in typelib:
-                for _, tp in typelib[size]:
-                    self.typstr_to_piece[str(tp)] = tp.tokenize()[:-1]
+        typelib = load_typelib(self.config["data"]["typelib_file"])
+        self.typstr_to_piece = {}
+        for size in typelib:
+            for _, tp in typelib[size]:
+                self.typstr_to_piece[str(tp)] = tp.tokenize()[:-1]
         self.typstr_to_piece["<unk>"] = ["<unk>"]
 
     def training_step(
@@ -285,6 +287,9 @@ class TypeReconstructionModel(pl.LightningModule):
         batch_idx,
     ):
         input_dict, target_dict = batch
+        if input_dict.get("dataset_state") is not None:
+            worker_id, state = input_dict["dataset_state"]
+            self.dataset_states[worker_id] = state
         total_loss = 0
         context_encoding = self.encoder(input_dict)
         if self.interleave:
@@ -310,6 +315,21 @@ class TypeReconstructionModel(pl.LightningModule):
         self.log("train_loss", total_loss)
         return total_loss
 
+    def on_save_checkpoint(self, checkpoint):
+        # saved so that an interrupted epoch can be resumed, see exp.py
+        checkpoint["dataset_states"] = self.dataset_states
+
+    def on_load_checkpoint(self, checkpoint):
+        # the workers that have not emitted a batch yet in the resumed epoch are
+        # still at the positions they resumed from
+        self.dataset_states = dict(checkpoint.get("dataset_states") or {})
+        self.resumed = True
+
+    def on_train_epoch_start(self):
+        if not self.resumed:
+            self.dataset_states = {}
+        self.resumed = False
+
     def validation_step(self, batch, batch_idx):
         return self._shared_eval_step(batch, batch_idx)
 
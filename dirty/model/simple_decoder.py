@@ -3,14 +3,14 @@ from typing import Dict, List
 import torch
 from torch import nn as nn
 from utils import util
-from utils.vocab import Vocab
+from utils.registry import load_vocab
 
 
 class SimpleDecoder(nn.Module):
     def __init__(self, config):
         super(SimpleDecoder, self).__init__()
 
-        self.vocab = vocab = Vocab.load(config["vocab_file"])
+        self.vocab = vocab = load_vocab(config["vocab_file"])
         self.output = nn.Linear(
             config["hidden_size"],
             len(vocab.names) if config.get("rename", False) else len(vocab.types),
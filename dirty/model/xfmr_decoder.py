@@ -5,8 +5,7 @@ import torch.nn as nn
 from torch.nn import TransformerDecoder, TransformerDecoderLayer, LayerNorm
 from torch.nn.modules import activation
 from utils import util
-from utils.vocab import Vocab
-from utils.dire_types import TypeLibCodec
+from utils.registry import load_typelib, load_vocab
 from .beam import Beam
 
 
@@ -30,9 +29,8 @@ class XfmrDecoder(nn.Module):
     def __init__(self, config):
         super(XfmrDecoder, self).__init__()
 
-        self.vocab = Vocab.load(config["vocab_file"])
-        with open(config["typelib_file"]) as type_f:
-            self.typelib = TypeLibCodec.decode(type_f.read())
+        self.vocab = load_vocab(config["vocab_file"])
+        self.typelib = load_typelib(config["typelib_file"])
         vocab_size = (
             len(self.vocab.names)
             if config.get("rename", False)
@@ -333,9 +331,8 @@ class XfmrInterleaveDecoder(XfmrDecoder):
     def __init__(self, config):
         super(XfmrDecoder, self).__init__()
 
-        self.vocab = Vocab.load(config["vocab_file"])
-        with open(config["typelib_file"]) as type_f:
-            self.typelib = TypeLibCodec.decode(type_f.read())
+        self.vocab = load_vocab(config["vocab_file"])
+        self.typelib = load_typelib(config["typelib_file"])
 
         retype_vocab_size = len(self.vocab.types)
         rename_vocab_size = len(self.vocab.names)
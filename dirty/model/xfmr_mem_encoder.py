@@ -7,7 +7,8 @@ import torch
 import torch.nn as nn
 from torch.nn import TransformerEncoder, TransformerEncoderLayer
 from utils import util
-from utils.vocab import PAD_ID, Vocab
+from utils.registry import load_vocab
+from utils.vocab import PAD_ID
 
 from .encoder import Encoder
 
@@ -56,7 +57,7 @@ class XfmrMemEncoder(Encoder):
     def __init__(self, config):
         super().__init__()
 
-        vocab = Vocab.load(config["vocab_file"])
+        vocab = load_vocab(config["vocab_file"])
         reg_pos_size = len(vocab.regs)
         self.src_word_embed = nn.Embedding(
             1030 + reg_pos_size, config["source_embedding_size"]
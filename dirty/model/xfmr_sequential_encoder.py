@@ -7,7 +7,8 @@ import torch
 import torch.nn as nn
 from torch.nn import TransformerEncoder, TransformerEncoderLayer
 from utils import util
-from utils.vocab import PAD_ID, Vocab
+from utils.registry import load_vocab
+from utils.vocab import PAD_ID
 
 from .encoder import Encoder
 
@@ -55,7 +56,7 @@ class XfmrSequentialEncoder(Encoder):
     def __init__(self, config):
         super().__init__()
 
-        self.vocab = vocab = Vocab.load(config["vocab_file"])
+        self.vocab = vocab = load_vocab(config["vocab_file"])
 
         self.src_word_embed = nn.Embedding(
             len(vocab.source_tokens), config["source_embedding_size"]
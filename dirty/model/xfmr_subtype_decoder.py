@@ -5,8 +5,7 @@ import torch.nn as nn
 from torch.nn import TransformerDecoder, TransformerDecoderLayer, LayerNorm
 from torch.nn.modules import activation
 from utils import util
-from utils.vocab import Vocab
-from utils.dire_types import TypeLibCodec
+from utils.registry import load_typelib, load_vocab
 from model.xfmr_decoder import XfmrDecoder
 
 
@@ -14,10 +13,8 @@ class XfmrSubtypeDecoder(XfmrDecoder):
     def __init__(self, config):
         super(XfmrDecoder, self).__init__()
 
-        self.vocab = Vocab.load(config["vocab_file"])
-        with open(config["typelib_file"]) as type_f:
-            self.typelib = TypeLibCodec.decode(type_f.read())
-            self.typelib = self.typelib.fix()
+        self.vocab = load_vocab(config["vocab_file"])
+        self.typelib = load_typelib(config["typelib_file"], fixed=True)
         self.target_embedding = nn.Embedding(
             len(self.vocab.subtypes), config["target_embedding_size"]
         )
@@ -1,19 +1,42 @@
 """
-Given test/train set argument, untars test OR dev OR train shard sets and filters through .jsonl files
-based on obfuscation type (adv obf, llvm fla, llvm sub, llvm bcf) given meta_data file
+Given test/train set argument, splits test OR dev OR train shard sets into one tar file per
+obfuscation type (adv obf, llvm fla, llvm sub, llvm bcf, none) given meta_data file
 - DOES NOT alter the original tar file(s), it creates new tar files
+- Each input tar is read once and its .jsonl files are routed to the new tar files
+  without extracting them; train shards are split in parallel
 
 @author: Deniz BT (Summer 2023 REUSE Student) [Jan 2024]
 """
 
 import os
-import subprocess
 import argparse
-import json
-import fnmatch
 import glob
+import multiprocessing
+import tarfile
 from tqdm import tqdm
 
+from utils.metadata_store import MetadataStore
+from utils.shard_index import ShardIndex
+
+# the new tar files are named <process type>_<kind>.tar
+KINDS = ["adv_obf", "llvm_bcf", "llvm_fla", "llvm_sub", "nones"]
+# kind of each obfuscation in the meta_data, anything else goes to llvm_bcf
+OBFUSCATION_KINDS = {
+    "none": "nones",
+    "adv-obfuscation": "adv_obf",
+    "llvm-obfuscation-fla": "llvm_fla",
+    "llvm-obfuscation-sub": "llvm_sub",
+}
+DEFAULT_KIND = "llvm_bcf"
+# labels of the counts in <process type>_obf_nums.txt
+COUNT_LABELS = [
+    ("adv_obf", "# adv_obf files:"),
+    ("llvm_bcf", "# llvm_bcf files:"),
+    ("llvm_sub", "# llvm_sub files"),
+    ("llvm_fla", "# llvm_fla files"),
+    ("nones", "# no obf files"),
+]
+
 
 def get_args():
     parser = argparse.ArgumentParser()
@@ -21,175 +44,162 @@ def get_args():
         "--dataset-folder", type=str, default="dataset_larger"
     )  # folder with tar files
     parser.add_argument("--process-type", type=str, default="dev")
+    parser.add_argument(
+        "--num-workers", type=int, default=16
+    )  # train shards split in parallel
     return parser.parse_args()
 
 
 def main():
-    os.chdir(args.dataset_folder)
     args = get_args()
+    os.chdir(args.dataset_folder)
 
     meta_file = f"{args.process_type}-set-metadata.json"
-    with open(meta_file, "r") as fp:
-        content = json.load(fp)
-    meta_data = {d["hash_name"]: d for d in content}
-    print("Loaded meta_data from JSON file.")
+    # built once here rather than by every worker
+    MetadataStore.open(meta_file).close()
+    print("Opened the meta_data store.")
 
     if args.process_type == "test" or args.process_type == "dev":
-        process_test_or_dev_set(args, meta_data)
+        counts = process_test_or_dev_set(args, meta_file)
     elif args.process_type == "train":
-        process_train_set(args, meta_data)
-
-
-def move_files(args, meta_data, files):
-    adv_folder = f"{args.process_type}_adv_obf"
-    bcf_folder = f"{args.process_type}_llvm_bcf"
-    fla_folder = f"{args.process_type}_llvm_fla"
-    sub_folder = f"{args.process_type}_llvm_sub"
-    none_folder = f"{args.process_type}_nones"
-    for file in tqdm(files):
-        if file.endswith(".jsonl"):
-            file_name = file.split("_")[0]
-            entry = meta_data[file_name]
-            # print(entry)
-
-            if entry["obfuscation"] == "none":
-                subprocess.run(
-                    ["mv", f"{bcf_folder}/{file}", f"{none_folder}/{file}"])
-            elif entry["obfuscation"] == "adv-obfuscation":
-                subprocess.run(
-                    ["mv", f"{bcf_folder}/{file}", f"{adv_folder}/{file}"])
-            elif entry["obfuscation"] == "llvm-obfuscation-fla":
-                subprocess.run(
-                    ["mv", f"{bcf_folder}/{file}", f"{fla_folder}/{file}"])
-            elif entry["obfuscation"] == "llvm-obfuscation-sub":
-                subprocess.run(
-                    ["mv", f"{bcf_folder}/{file}", f"{sub_folder}/{file}"])
-
-
-def process_train_set(args, meta_data):
-    folders = [
-        "train_adv_obf",
-        "train_llvm_bcf",
-        "train_llvm_fla",
-        "train_llvm_sub",
-        "train_nones",
-    ]
-    for f in folders:
-        subprocess.run(["mkdir", "-p", f])
-
-    for train_shard in glob.glob("train-shard-*.tar"):
-        # untar train shard tar to the bcf folder
-        subprocess.run(["tar", "-C", folders[1], "-xf", train_shard])
-
-        # go through files in bcf_folder and move them to the correct folders
-        bcf_files = os.listdir(folders[1])
-        move_files(args, meta_data, bcf_files)
-
-    # tar the folders
-    subprocess.run(["tar", "-C", folders[0], "-cf", "train_adv_obf.tar", "."])
-    subprocess.run(["tar", "-C", folders[1], "-cf", "train_llvm_bcf.tar", "."])
-    subprocess.run(["tar", "-C", folders[2], "-cf", "train_llvm_fla.tar", "."])
-    subprocess.run(["tar", "-C", folders[3], "-cf", "train_llvm_sub.tar", "."])
-    subprocess.run(["tar", "-C", folders[4], "-cf", "train_nones.tar", "."])
-
-    # count the number of files in each folder, add to file
-    with open("train_obf_nums.txt", "w+") as f:
-        f.write(
-            f'# adv_obf files: {len(fnmatch.filter(os.listdir(folders[0]), "*.*"))}\n'
-        )
-        f.write(
-            f'# llvm_bcf files: {len(fnmatch.filter(os.listdir(folders[1]), "*.*"))}\n'
-        )
-        f.write(
-            f'# llvm_sub files {len(fnmatch.filter(os.listdir(folders[2]), "*.*"))}\n'
-        )
-        f.write(
-            f'# llvm_fla files {len(fnmatch.filter(os.listdir(folders[3]), "*.*"))}\n'
-        )
-        f.write(
-            f'# no obf files {len(fnmatch.filter(os.listdir(folders[4]), "*.*"))}\n'
-        )
-
-    # delete the original folders
-    for folder in folders:
-        subprocess.run(["rm", "-rf", folder])
+        counts = process_train_set(args, meta_file)
+    else:
+        raise ValueError(f"unknown process type {args.process_type}")
 
+    # count the number of files of each obfuscation, add to file
+    with open(f"{args.process_type}_obf_nums.txt", "w+") as f:
+        for kind, label in COUNT_LABELS:
+            f.write(f"{label} {counts[kind]}\n")
+
+
+def split_tar(args):
+    """Route the .jsonl files of a tar file to one tar file per kind of
+    obfuscation, named <out_prefix>_<kind>.tar<out_suffix>.
+
+    Returns for each kind the number of files, the offset where the end of
+    archive blocks of its tar file start, and the index entries of its files
+    if the input tar is indexed."""
+    tar_path, meta_file, out_prefix, out_suffix = args
+    meta_data = MetadataStore(MetadataStore.store_path(meta_file))
+    in_index = ShardIndex.load(tar_path)
+    in_members = (
+        {member["name"]: member for member in in_index.members}
+        if in_index is not None
+        else None
+    )
+    outs = {
+        kind: tarfile.open(f"{out_prefix}_{kind}.tar{out_suffix}", "w")
+        for kind in KINDS
+    }
+    counts = {kind: 0 for kind in KINDS}
+    index_members = {kind: [] for kind in KINDS}
+    try:
+        # streamed, every member is read once
+        with tarfile.open(tar_path, "r|") as tar:
+            for member in tar:
+                if not member.isreg():
+                    continue
+                kind = DEFAULT_KIND
+                if member.name.endswith(".jsonl"):
+                    file_name = os.path.basename(member.name).split("_")[0]
+                    obfuscation = meta_data.obfuscation_of(file_name)
+                    if obfuscation is None:
+                        print(f"{file_name} not found in {meta_file}.")
+                    kind = OBFUSCATION_KINDS.get(obfuscation, DEFAULT_KIND)
+                    counts[kind] += 1
+                out = outs[kind]
+                out.addfile(member, tar.extractfile(member))
+                if in_members is not None and member.name in in_members:
+                    # the data ends at the current offset, padded to a block
+                    blocks = -(-member.size // tarfile.BLOCKSIZE)
+                    index_member = dict(in_members[member.name])
+                    index_member["offset"] = out.offset - blocks * tarfile.BLOCKSIZE
+                    index_members[kind].append(index_member)
+        ends = {kind: out.offset for kind, out in outs.items()}
+    finally:
+        for out in outs.values():
+            out.close()
+        meta_data.close()
+    if in_index is None:
+        index_members = None
+    return counts, ends, index_members
+
+
+def save_index(tar_path, index_members):
+    if index_members is not None:
+        ShardIndex(tar_path, index_members).save()
+
+
+def process_train_set(args, meta_file):
+    # split the train shards in parallel into one part per shard and kind,
+    # then concatenate the parts of each kind
+    train_shards = sorted(
+        glob.glob("train-shard-*.tar"),
+        key=lambda shard: int(shard[len("train-shard-"): -len(".tar")]),
+    )
+    print(f"Splitting {len(train_shards)} train shards.")
+    with multiprocessing.Pool(args.num_workers) as pool:
+        parts = list(
+            tqdm(
+                pool.imap(
+                    split_tar,
+                    [
+                        (train_shard, meta_file, "train", f".part{shard_id}")
+                        for shard_id, train_shard in enumerate(train_shards)
+                    ],
+                ),
+                total=len(train_shards),
+            )
+        )
 
-def process_test_or_dev_set(args, meta_data):
+    counts = {kind: 0 for kind in KINDS}
+    for kind in KINDS:
+        tar_path = f"train_{kind}.tar"
+        index_members = []
+        with open(tar_path, "wb") as out:
+            for shard_id, (part_counts, ends, part_index_members) in enumerate(parts):
+                part_path = f"{tar_path}.part{shard_id}"
+                base = out.tell()
+                # a tar file followed by another is one tar file once its end
+                # of archive blocks are dropped
+                with open(part_path, "rb") as part:
+                    remaining = ends[kind]
+                    while remaining > 0:
+                        chunk = part.read(min(remaining, 1 << 20))
+                        out.write(chunk)
+                        remaining -= len(chunk)
+                os.remove(part_path)
+                counts[kind] += part_counts[kind]
+                if index_members is not None and part_index_members is not None:
+                    for member in part_index_members[kind]:
+                        member["offset"] += base
+                        index_members.append(member)
+                else:
+                    index_members = None
+            # the end of archive blocks, padded to a record like tarfile does
+            size = out.tell() + 2 * tarfile.BLOCKSIZE
+            size = -(-size // tarfile.RECORDSIZE) * tarfile.RECORDSIZE
+            out.write(b"\0" * (size - out.tell()))
+        save_index(tar_path, index_members)
+    print("Tar-ed the new train partitions.")
+    return counts
+
+
+def process_test_or_dev_set(args, meta_file):
     # create five different test sets (adv-obf, llvm-bcf, llvm-sub, llvm-fla, none)
     print(
         f"Creating {args.process_type} sets for each of the five types of obfuscations."
     )
-
-    # create temp folders
-    obf_folders = [
-        f"{args.process_type}_adv_obf",
-        f"{args.process_type}_llvm_bcf",
-        f"{args.process_type}_llvm_fla",
-        f"{args.process_type}_llvm_sub",
-        f"{args.process_type}_nones",
-    ]
-    adv_folder = obf_folders[0]
-    bcf_folder = obf_folders[1]
-    fla_folder = obf_folders[2]
-    sub_folder = obf_folders[3]
-    none_folder = obf_folders[4]
-
-    for folder in obf_folders:
-        subprocess.run(["mkdir", "-p", folder])
-
-    # untar test.tar to bcf_folder (will move binaries from there to the others as needed)
-    subprocess.run(["tar", "-C", bcf_folder, "-xf",
-                   f"{args.process_type}.tar"])
-
-    bcf_files = os.listdir(bcf_folder)
-    move_files(args, meta_data, bcf_files)
-
-    # tar the folders
-    subprocess.run(
-        ["tar", "-C", bcf_folder, "-cf",
-            f"{args.process_type}_llvm_bcf.tar", "."]
-    )
-    subprocess.run(
-        ["tar", "-C", adv_folder, "-cf",
-            f"{args.process_type}_adv_obf.tar", "."]
-    )
-    subprocess.run(
-        ["tar", "-C", sub_folder, "-cf",
-            f"{args.process_type}_llvm_sub.tar", "."]
-    )
-    subprocess.run(
-        ["tar", "-C", fla_folder, "-cf",
-            f"{args.process_type}_llvm_fla.tar", "."]
+    counts, _, index_members = split_tar(
+        (f"{args.process_type}.tar", meta_file, args.process_type, "")
     )
-    subprocess.run(
-        ["tar", "-C", none_folder, "-cf",
-            f"{args.process_type}_nones.tar", "."]
-    )
-    print(f"Tar-ed the new {args.process_type} partitions.")
-    # subprocess.run(["tar", "cf", "test_tigress.tar"], cwd=tigress_folder)
-
-    # count the number of files in each folder, add to file
-    with open(f"{args.process_type}_obf_nums.txt", "w+") as f:
-        f.write(
-            f'# adv_obf files: {len(fnmatch.filter(os.listdir(adv_folder), "*.*"))}\n'
-        )
-        f.write(
-            f'# llvm_bcf files: {len(fnmatch.filter(os.listdir(bcf_folder), "*.*"))}\n'
-        )
-        f.write(
-            f'# llvm_sub files {len(fnmatch.filter(os.listdir(sub_folder), "*.*"))}\n'
-        )
-        f.write(
-            f'# llvm_fla files {len(fnmatch.filter(os.listdir(fla_folder), "*.*"))}\n'
+    for kind in KINDS:
+        save_index(
+            f"{args.process_type}_{kind}.tar",
+            index_members[kind] if index_members is not None else None,
         )
-        f.write(
-            f'# no obf files {len(fnmatch.filter(os.listdir(none_folder), "*.*"))}\n'
-        )
-
-    # delete the original folders
-    for folder in obf_folders:
-        subprocess.run(["rm", "-rf", folder])
+    print(f"Tar-ed the new {args.process_type} partitions.")
+    return counts
 
 
 if __name__ == "__main__":
@@ -0,0 +1,121 @@
+import json
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+DIRTY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the modules are imported as `utils.*` and `model.*`, like the scripts in dirty/
+sys.path.insert(0, DIRTY_DIR)
+
+TYPES = [
+    {"T": 1, "n": "int", "s": 4},
+    {"T": 1, "n": "char", "s": 1},
+    {"T": 1, "n": "__int64", "s": 8},
+    {"T": 3, "t": "char"},
+    {"T": 2, "n": 4, "s": 4, "t": "int"},
+    {
+        "T": 6,
+        "n": "foo",
+        "l": [
+            {"T": 4, "n": "a", "t": "int", "s": 4},
+            {"T": 5, "s": 4},
+            {"T": 4, "n": "b", "t": "long", "s": 8},
+        ],
+    },
+]
+NAMES = ["count", "buf", "len", "ptr", "idx", "tmp", "res", "node"]
+STATEMENTS = [
+    ["{a}", "=", "{b}", "+", "Number", ";"],
+    ["if", "(", "{a}", ">=", "Number", ")", "{b}", "+=", "Number", ";"],
+    ["printf", "(", "String", ",", "{a}", ")", ";"],
+    ["{a}", "=", "*", "(", "_QWORD", "*", ")", "(", "{b}", "+", "Number", ")", ";"],
+    ["return", "{a}", "&&", "{b}", ";"],
+]
+
+
+def _example(rng: random.Random, name: str) -> dict:
+    source, target, variables = {}, {}, []
+    for i in range(rng.randint(1, 4)):
+        location = f"s{8 * (i + 1)}" if rng.random() < 0.5 else f"r{8 * i}"
+        variables.append(f"@@v{i + 1}@@")
+        source[location] = {"t": rng.choice(TYPES), "n": f"v{i + 1}", "u": False}
+        target[location] = {
+            "t": rng.choice(TYPES),
+            "n": f"{rng.choice(NAMES)}{i}",
+            "u": True,
+        }
+    code_tokens = ["int", "__fastcall", name, "(", "int", "a1", ")", "{"]
+    for _ in range(rng.randint(1, 12)):
+        a, b = rng.choice(variables), rng.choice(variables)
+        code_tokens += [
+            token.format(a=a, b=b) for token in rng.choice(STATEMENTS)
+        ]
+    code_tokens.append("}")
+    return {"name": name, "code_tokens": code_tokens, "source": source, "target": target}
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cache_dir(tmp_path_factory):
+    """Keeps the pickles of utils/registry.py out of the user cache"""
+    os.environ["DIRTY_CACHE_DIR"] = str(tmp_path_factory.mktemp("cache"))
+
+
+@pytest.fixture(scope="session")
+def dataset_dir(tmp_path_factory):
+    """Indexed train shards of synthetic examples, with their typelib and vocab"""
+    from utils.dire_types import TypeLib, TypeLibCodec
+    from utils.preprocess import ShardWriter
+
+    path = tmp_path_factory.mktemp("dataset")
+    rng = random.Random(0)
+    typelib = TypeLib()
+    with ShardWriter(str(path / "train-shard-{}.tar"), max_files=6) as writer:
+        for binary in range(24):
+            examples = [
+                _example(rng, f"func_{i}") for i in range(rng.randint(1, 20))
+            ]
+            for example in examples:
+                for var in example["target"].values():
+                    typelib.add(TypeLibCodec.decode(json.dumps(var["t"])))
+            writer.write(
+                f"{binary:08x}_bin{binary}.jsonl",
+                "".join(json.dumps(example) + "\n" for example in examples).encode(),
+                [example["name"] for example in examples],
+            )
+    typelib.sort()
+    with open(path / "typelib.json", "w") as f:
+        f.write(TypeLibCodec.encode(typelib))
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "utils.vocab",
+            "--use-bpe",
+            "--size=80",
+            "--freq-cutoff=0",
+            "--workers=1",
+            str(path / "train-shard-*.tar"),
+            str(path / "typelib.json"),
+            str(path / "vocab.bpe"),
+        ],
+        cwd=DIRTY_DIR,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return path
+
+
+@pytest.fixture
+def dataset_config(dataset_dir):
+    """The data config of dataset_dir"""
+    return dict(
+        vocab_file=str(dataset_dir / "vocab.bpe"),
+        typelib_file=str(dataset_dir / "typelib.json"),
+        max_src_tokens_len=510,
+        max_num_var=32,
+        rename=True,
+    )
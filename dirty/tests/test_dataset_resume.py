@@ -0,0 +1,56 @@
+import io
+from collections import Counter
+
+import pytest
+import torch
+
+from utils.dataset import Dataset
+
+
+def _epoch(dataset, max_tokens, stop=None, num_workers=2):
+    """The examples of the first stop batches, by (binary, name), and the
+    latest state of each worker"""
+    loader = torch.utils.data.DataLoader(
+        dataset,
+        batch_size=None if max_tokens else 8,
+        num_workers=num_workers,
+        collate_fn=Dataset.collate_fn,
+    )
+    examples = Counter()
+    states = {}
+    for step, (input_dict, _) in enumerate(loader):
+        if step == stop:
+            break
+        examples.update({(binary, name) for binary, name, _ in input_dict["index"]})
+        worker_id, state = input_dict["dataset_state"]
+        states[worker_id] = state
+    return examples, states
+
+
+@pytest.mark.parametrize("max_tokens", [None, 400])
+@pytest.mark.parametrize("stop", [1, 4, 10])
+def test_resume_mid_epoch(dataset_dir, dataset_config, max_tokens, stop):
+    url = str(dataset_dir / "train-shard-*.tar")
+    config = dataset_config
+    full, _ = _epoch(Dataset(url, config, max_tokens=max_tokens), max_tokens)
+    first, states = _epoch(Dataset(url, config, max_tokens=max_tokens), max_tokens, stop)
+    # saved in checkpoints, see TypeReconstructionModel.on_save_checkpoint
+    buffer = io.BytesIO()
+    torch.save(states, buffer)
+    buffer.seek(0)
+    states = torch.load(buffer, weights_only=True)
+    rest, _ = _epoch(
+        Dataset(url, config, max_tokens=max_tokens, resume_state=states), max_tokens
+    )
+    assert first and rest
+    # neither lost nor replayed
+    assert first + rest == full
+    assert set(full.values()) == {1}
+
+
+def test_resume_with_other_num_workers(dataset_dir, dataset_config):
+    url = str(dataset_dir / "train-shard-*.tar")
+    config = dataset_config
+    _, states = _epoch(Dataset(url, config), None, 2)
+    with pytest.raises(ValueError, match="saved with 2"):
+        _epoch(Dataset(url, config, resume_state=states), None, num_workers=3)
@@ -0,0 +1,40 @@
+import pytest
+
+from utils.code_processing import tokenize_raw_code
+
+# Edge cases of the Pygments lexer
+CORPUS = [
+    "__int64 __fastcall main(int a1, char **a2, char **a3)\n{\n  return 0LL;\n}",
+    'int a = "asdfsdf"; int b =123; a = asd::safd() sadf=12 /*asdf*/',
+    "__int64 (__fastcall **)(unsigned __int64, signed __int64, __int64, _QWORD)",
+    'void f()\n{\n  puts("a" "b""c");\n  v1 = L"wide\\n\\x41\\"q";\n  c = \'\\x41\'; d = \'\\0\'; e = \'\'\';\n}',
+    "x = 1.5e3f + .5 + 1. + 0x1Fu + 0777 + 089 + 12LL + 1e+9 + 3f + 0x + 1..2;",
+    "a->b++; --c; d <<= 2; e >>= 1; f = g << h >> i; j ... k ## l; m::n; ::o;",
+    "LABEL_12:\n  goto LABEL_12;\n  x = y ? z : w; default: case 1: a ::b; c :: d;",
+    "v1 = @@VAR_0@@v1@@a1 + @@VAR_12@@x@@y; @@bad@@; $ ` \\ @",
+    '#include <stdio.h>\n#define X(a) a \\\n  + 1\nint x;\n  # pragma once // c\n/* m\nl */ #x\n',
+    "#if 0\nint a;\n#if 1\nb\n#endif\n#else\nint c;\n#endif\nint d;",
+    "  /* c */ #if 0\nq\n#elif 1\nint e;\n",
+    "/* a */ int b; /* c */#define d\ne;",
+    'char *s = "unterminated\nint after = 1;\n',
+    "// only a comment",
+    "/* open comment\n int x;",
+    "int f(int a)\n{\n  if ( a )\n  {\n    g();\n  }\n  else\n  {\n    h(); }\n  }\n}\nint g(char c) { return c; }",
+    'int f(int a, char *b = ")") {\n  return 1;\n}\nvoid g(void);\nint h(int) { }',
+    "int f(/* a ) */ int x) { } int g(\"s(\") ; int h(int x) \"q\" { }",
+    "unsigned int __cdecl sub_401000(void *this, __m128i a, wchar_t b)\n{\n  __asm { int 3 }\n  JUMPOUT(0x401020);\n}",
+    "\r\n\r\nint x;\r\ny = 'a';\rz;\n\n\n",
+    "\ufeffint bom;",
+    "v3 = *(_DWORD *)(a1 + 8) & 0xFFFFFFF0;\n  *(_BYTE *)v2 = -1; v4 = ~v5 ^ !v6 % 7;",
+    "naïve = é + 变量; x = 1ü;",
+    "}}} ;;; {{{",
+    "",
+    "\n\n",
+]
+
+
+@pytest.mark.parametrize("code", CORPUS)
+def test_same_tokens_as_pygments(code):
+    assert tokenize_raw_code(code, tokenizer="fast") == tokenize_raw_code(
+        code, tokenizer="pygments"
+    )
@@ -0,0 +1,31 @@
+from utils.function_digests import SqliteFunctionDigests, function_digests
+
+
+def _digests(*functions):
+    return dict(function_digests(name, code) for name, code in functions)
+
+
+def test_sqlite_digests_reopened_with_create(tmp_path):
+    path = str(tmp_path / "digests.sqlite")
+    for run in range(2):
+        digests = SqliteFunctionDigests(path, create=True)
+        digests.add_file("train", _digests(("f", "return 0;"), ("g", "return 1;")))
+        digests.add_file("test", _digests(("f", "return 2;"), ("h", "return 3;")))
+        digests.set_train_files(["train"])
+        name_f, body_f = function_digests("f", "return 2;")
+        name_h, body_h = function_digests("h", "return 3;")
+        assert digests.name_in_train(name_f)
+        assert not digests.body_in_train(body_f)
+        assert not digests.name_in_train(name_h)
+        assert not digests.body_in_train(body_h)
+        digests.close()
+
+
+def test_sqlite_digests_set_train_files_twice(tmp_path):
+    digests = SqliteFunctionDigests(str(tmp_path / "digests.sqlite"))
+    digests.add_file("a", _digests(("f", "return 0;")))
+    digests.add_file("b", _digests(("g", "return 1;")))
+    digests.set_train_files(["a"])
+    digests.set_train_files(["b"])
+    assert digests.name_in_train(function_digests("g", "return 1;")[0])
+    digests.close()
@@ -0,0 +1,31 @@
+from collections import Counter
+
+import pytest
+
+from utils.dataset import Dataset
+
+
+@pytest.mark.parametrize("max_tokens", [30, 200, 2000])
+def test_batches_fit_max_tokens(
+    dataset_dir, dataset_config, monkeypatch, max_tokens
+):
+    # several pools, the last of which is only flushed at the end of the stream
+    monkeypatch.setattr(Dataset, "BUCKET_BUFFER", 50)
+    url = str(dataset_dir / "train-shard-*.tar")
+    config = dataset_config
+    expected = Counter(
+        (example.binary, example.name) for example in Dataset(url, config)
+    )
+    assert sum(expected.values()) % Dataset.BUCKET_BUFFER
+    examples = Counter()
+    for batch in Dataset(url, config, max_tokens=max_tokens):
+        input_dict, _ = Dataset.collate_fn(batch)
+        batch_size, max_len = input_dict["src_code_tokens"].shape
+        assert batch_size == len(batch)
+        if max_len > max_tokens:
+            # an example longer than the budget is batched on its own
+            assert batch_size == 1
+        else:
+            assert batch_size * max_len <= max_tokens
+        examples.update((example.binary, example.name) for example in batch)
+    assert examples == expected
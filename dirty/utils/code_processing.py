@@ -1,6 +1,7 @@
 import re
 from typing import List, Set
 
+from utils import fast_lexer
 from utils.lexer import *
 
 
@@ -16,10 +17,23 @@ def canonicalize_code(code):
     return code
 
 
-def tokenize_raw_code(raw_code):
+# "fast" (utils/fast_lexer.py) or "pygments" (utils/lexer.py), which give the same tokens
+TOKENIZER = "fast"
+
+
+def set_tokenizer(tokenizer):
+    global TOKENIZER
+    if tokenizer not in ("fast", "pygments"):
+        raise ValueError(f"unknown tokenizer {tokenizer}, expected fast or pygments")
+    TOKENIZER = tokenizer
+
+
+def tokenize_raw_code(raw_code, tokenizer=None):
     #print(f"raw code {raw_code}")
     if raw_code is None:
         return None
+    if (tokenizer or TOKENIZER) == "fast":
+        return fast_lexer.tokenize(raw_code)
     lexer = Lexer(raw_code)
     tokens = []
     for token_type, token in lexer.get_tokens():
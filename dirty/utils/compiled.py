@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+"""
+Compile annotated examples into flat, memory-mapped arrays.
+
+Usage:
+    compiled.py [options] CONFIG_FILE
+
+Options:
+    -h --help                  Show this screen.
+    --splits=<str>             comma-separated data splits to compile [default: train,dev,test]
+    --workers=<int>            number of worker processes [default: 8]
+"""
+
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# bumped when the files of a compiled shard change
+COMPILED_FORMAT_VERSION = 3
+
+# Ragged fields grouped by the offsets table that indexes them.
+# Every group maps an example (or a variable, for "mem") to a slice of its arrays.
+OFFSET_GROUPS = {
+    "token": ["sub_token_ids"],
+    "var": ["src_var_types", "tgt_var_types", "tgt_var_type_sizes", "tgt_var_name_ids"],
+    "subtype": ["tgt_var_subtypes"],
+    "mention": ["mention_positions", "mention_var_ids"],
+    "mem": ["tgt_var_src_mems"],
+}
+# Strings and other small python values, stored as ids into the table of the
+# distinct values of a shard, one per example or one per variable
+EXAMPLE_META_FIELDS = ["binary", "name", "test_meta"]
+VAR_META_FIELDS = [
+    "src_var_names",
+    "tgt_var_names",
+    "src_var_types_str",
+    "tgt_var_types_str",
+]
+
+
+def compile_key(config: Dict) -> str:
+    """Hash of everything the annotated arrays depend on, except for the tar
+    shards themselves (see source_signature)"""
+    h = hashlib.sha1()
+    h.update(f"format {COMPILED_FORMAT_VERSION}\n".encode())
+    with open(config["vocab_file"], "rb") as f:
+        vocab_bytes = f.read()
+    h.update(vocab_bytes)
+    subtoken_model_path = (
+        json.loads(vocab_bytes)["source_tokens"].get("subtoken_model_path")
+    )
+    if subtoken_model_path:
+        with open(subtoken_model_path, "rb") as f:
+            h.update(f.read())
+    with open(config["typelib_file"], "rb") as f:
+        h.update(f.read())
+    params = dict(
+        max_src_tokens_len=config["max_src_tokens_len"],
+        max_num_var=config["max_num_var"],
+        rename=config.get("rename", False),
+    )
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def source_signature(url: str) -> Dict[str, int]:
+    """Identifies the version of a tar shard a compiled shard is made from"""
+    stat = os.stat(url)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def compiled_path(compiled_dir: str, key: str, url: str) -> str:
+    """Location of the compiled arrays of a tar shard"""
+    shard_name = os.path.basename(url)
+    if shard_name.endswith(".tar"):
+        shard_name = shard_name[: -len(".tar")]
+    return os.path.join(compiled_dir, key, shard_name)
+
+
+class CompiledShardWriter:
+    """Accumulates annotated examples of one shard and dumps them as .npy arrays"""
+
+    def __init__(self, path: str, header: Dict, rename: bool = False):
+        self.path = path
+        self.header = header
+        self.rename = rename
+        self.arrays: Dict[str, List[int]] = {
+            field: []
+            for fields in list(OFFSET_GROUPS.values())
+            + [EXAMPLE_META_FIELDS, VAR_META_FIELDS]
+            for field in fields
+        }
+        self.offsets: Dict[str, List[int]] = {group: [0] for group in OFFSET_GROUPS}
+        self.values: List = []
+        self.value_ids: Dict[str, int] = {}
+
+    def _value_id(self, value) -> int:
+        key = json.dumps(value, sort_keys=True)
+        if key not in self.value_ids:
+            self.value_ids[key] = len(self.values)
+            self.values.append(value)
+        return self.value_ids[key]
+
+    def add(self, example) -> None:
+        self.arrays["sub_token_ids"] += example.sub_token_ids.tolist()
+        self.arrays["src_var_types"] += example.src_var_types.tolist()
+        self.arrays["tgt_var_types"] += example.tgt_var_types.tolist()
+        self.arrays["tgt_var_type_sizes"] += example.tgt_var_type_sizes.tolist()
+        if self.rename:
+            self.arrays["tgt_var_name_ids"] += example.tgt_var_name_ids.tolist()
+        self.arrays["tgt_var_subtypes"] += example.tgt_var_subtypes.tolist()
+        self.arrays["mention_positions"] += example.mention_positions.tolist()
+        self.arrays["mention_var_ids"] += example.mention_var_ids.tolist()
+        for mems in example.tgt_var_src_mems:
+            self.arrays["tgt_var_src_mems"] += mems.tolist()
+            self.offsets["mem"].append(len(self.arrays["tgt_var_src_mems"]))
+        self.offsets["token"].append(len(self.arrays["sub_token_ids"]))
+        self.offsets["var"].append(len(self.arrays["src_var_types"]))
+        self.offsets["subtype"].append(len(self.arrays["tgt_var_subtypes"]))
+        self.offsets["mention"].append(len(self.arrays["mention_positions"]))
+        for field in EXAMPLE_META_FIELDS:
+            self.arrays[field].append(self._value_id(getattr(example, field)))
+        for field in VAR_META_FIELDS:
+            self.arrays[field] += [
+                self._value_id(value) for value in getattr(example, field)
+            ]
+
+    def close(self) -> None:
+        # Write to a temporary folder first so that a partially compiled shard
+        # is never picked up by the Dataset
+        tmp_path = self.path + ".tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        for field, values in self.arrays.items():
+            if field == "tgt_var_name_ids" and not self.rename:
+                continue
+            np.save(os.path.join(tmp_path, f"{field}.npy"), np.array(values, dtype=np.int32))
+        for group, offsets in self.offsets.items():
+            np.save(
+                os.path.join(tmp_path, f"{group}.offsets.npy"),
+                np.array(offsets, dtype=np.int64),
+            )
+        with open(os.path.join(tmp_path, "values.json"), "w") as f:
+            json.dump(self.values, f)
+        with open(os.path.join(tmp_path, "header.json"), "w") as f:
+            json.dump({**self.header, "num_examples": len(self.arrays["binary"])}, f)
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.rename(tmp_path, self.path)
+
+
+class CompiledShard:
+    """Read-only view over a compiled shard.
+
+    Arrays are memory-mapped, so examples are slices into the page cache. The
+    number of examples is in the header, and the only parsing is that of the
+    table of distinct strings, when the first example is read.
+    """
+
+    def __init__(self, path: str, key: Optional[str] = None, url: Optional[str] = None):
+        """key: the compile_key the shard must have been compiled with, url:
+        the tar shard it must have been compiled from"""
+        header_path = os.path.join(path, "header.json")
+        if not os.path.exists(header_path):
+            if os.path.exists(path):
+                raise ValueError(
+                    f"{path} was compiled by an older version, run "
+                    "utils/compiled.py on the config again"
+                )
+            raise FileNotFoundError(
+                f"{path} is not compiled, run utils/compiled.py on the config first"
+            )
+        with open(header_path) as f:
+            self.header = json.load(f)
+        if self.header.get("format") != COMPILED_FORMAT_VERSION:
+            raise ValueError(
+                f"{path} has format {self.header.get('format')} instead of "
+                f"{COMPILED_FORMAT_VERSION}, run utils/compiled.py on the config again"
+            )
+        if key is not None and self.header["key"] != key:
+            raise ValueError(
+                f"{path} was compiled with key {self.header['key']} instead of {key}"
+            )
+        if url is not None and self.header["source"] != source_signature(url):
+            raise ValueError(
+                f"{path} was compiled from another version of {url}, run "
+                "utils/compiled.py on the config again"
+            )
+        self.path = path
+        self.arrays = {}
+        for fields in list(OFFSET_GROUPS.values()) + [
+            EXAMPLE_META_FIELDS,
+            VAR_META_FIELDS,
+        ]:
+            for field in fields:
+                array_path = os.path.join(path, f"{field}.npy")
+                if os.path.exists(array_path):
+                    self.arrays[field] = np.load(array_path, mmap_mode="r")
+        self.offsets = {
+            group: np.load(os.path.join(path, f"{group}.offsets.npy"), mmap_mode="r")
+            for group in OFFSET_GROUPS
+        }
+        self._values: Optional[List] = None
+
+    @property
+    def values(self) -> List:
+        """The distinct strings and test_meta of the shard"""
+        if self._values is None:
+            with open(os.path.join(self.path, "values.json")) as f:
+                self._values = json.load(f)
+        return self._values
+
+    def release(self) -> None:
+        """Free the table of values until the shard is read again"""
+        self._values = None
+
+    def __len__(self) -> int:
+        return self.header["num_examples"]
+
+    def _slice(self, group: str, field: str, idx: int) -> np.ndarray:
+        offsets = self.offsets[group]
+        return self.arrays[field][offsets[idx] : offsets[idx + 1]]
+
+    def __getitem__(self, idx: int):
+        from utils.dataset import AnnotatedExample
+
+        values = self.values
+        var_start, var_end = self.offsets["var"][idx], self.offsets["var"][idx + 1]
+        fields = {
+            field: values[self.arrays[field][idx]] for field in EXAMPLE_META_FIELDS
+        }
+        for field in VAR_META_FIELDS:
+            fields[field] = [
+                values[value_id] for value_id in self.arrays[field][var_start:var_end]
+            ]
+        mem_offsets = self.offsets["mem"]
+        mems = self.arrays["tgt_var_src_mems"]
+        if "tgt_var_name_ids" in self.arrays:
+            fields["tgt_var_name_ids"] = self._slice("var", "tgt_var_name_ids", idx)
+        return AnnotatedExample(
+            sub_token_ids=self._slice("token", "sub_token_ids", idx),
+            src_var_types=self._slice("var", "src_var_types", idx),
+            tgt_var_types=self._slice("var", "tgt_var_types", idx),
+            tgt_var_type_sizes=self._slice("var", "tgt_var_type_sizes", idx),
+            tgt_var_subtypes=self._slice("subtype", "tgt_var_subtypes", idx),
+            mention_positions=self._slice("mention", "mention_positions", idx),
+            mention_var_ids=self._slice("mention", "mention_var_ids", idx),
+            tgt_var_src_mems=[
+                mems[mem_offsets[var_id] : mem_offsets[var_id + 1]]
+                for var_id in range(var_start, var_end)
+            ],
+            **fields,
+        )
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+def compile_shard(args) -> int:
+    """Annotate all examples of a tar shard and write them as a compiled shard"""
+    import webdataset as wds
+    from utils.dataset import Dataset, Example
+
+    url, config, key, path = args
+    config = {name: val for name, val in config.items() if name != "compiled_dir"}
+    dataset = Dataset(url, config)
+    examples = (
+        wds.Dataset([url])
+        .pipe(Dataset._file_iter_to_line_iter)
+        .map(Example.from_json)
+        .pipe(dataset._annotate_buffer)
+    )
+    header = {
+        "format": COMPILED_FORMAT_VERSION,
+        "key": key,
+        "source": source_signature(url),
+    }
+    writer = CompiledShardWriter(path, header, rename=dataset.rename)
+    num_examples = 0
+    for example in examples:
+        writer.add(example)
+        num_examples += 1
+    writer.close()
+    return num_examples
+
+
+def main(args):
+    import _jsonnet
+    from tqdm import tqdm
+
+    config = json.loads(_jsonnet.evaluate_file(args["CONFIG_FILE"]))["data"]
+    compiled_dir = config["compiled_dir"]
+    key = compile_key(config)
+    os.makedirs(os.path.join(compiled_dir, key), exist_ok=True)
+    with open(os.path.join(compiled_dir, key, "config.json"), "w") as f:
+        json.dump(
+            {name: config[name] for name in ("vocab_file", "typelib_file")}, f, indent=2
+        )
+
+    jobs = []
+    for split in args["--splits"].split(","):
+        for url in sorted(glob.glob(config[f"{split}_file"])):
+            jobs.append((url, config, key, compiled_path(compiled_dir, key, url)))
+    print(f"compiling {len(jobs)} shards into {os.path.join(compiled_dir, key)}")
+    num_examples = 0
+    with multiprocessing.Pool(int(args["--workers"])) as pool:
+        for n in tqdm(pool.imap_unordered(compile_shard, jobs), total=len(jobs)):
+            num_examples += n
+    print(f"compiled {num_examples} examples")
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    main(docopt(__doc__))
@@ -1,5 +1,6 @@
 import glob
 import json
+import sys
 from collections import defaultdict
 from typing import Dict, List, Mapping, Optional, Set, Tuple, Union
 
@@ -8,12 +9,15 @@ import numpy as np
 import torch
 import webdataset as wds
 from torch.nn.utils.rnn import pad_sequence
+from webdataset.dataset import base_plus_ext
 from tqdm import tqdm
 
 from utils.code_processing import tokenize_raw_code
+from utils.json_decoder import JSONDecoder
+from utils.shard_index import ShardIndex
 from utils.function import CollectedFunction, Function
 from utils.variable import Location, Variable, location_from_json_key, Register, Stack
-from utils.dire_types import Struct, TypeLibCodec, TypeLib, UDT, TypeInfo, Disappear
+from utils.dire_types import Struct, TypeLib, UDT, TypeInfo, Disappear
 
 
 class Example:
@@ -28,6 +32,7 @@ class Example:
         raw_code: str = "",
         test_meta: Dict[str, Dict[str, bool]] = None,
         binary: str = None,
+        read_position: Optional[Tuple[int, int]] = None,
     ):
         self.name = name
         self.code_tokens = code_tokens
@@ -38,6 +43,8 @@ class Example:
         self.raw_code = raw_code
         self.test_meta = test_meta
         self.binary = binary
+        # (step, line) of the example in the read order of the dataset
+        self.read_position = read_position
 
     @classmethod
     def from_json(cls, d: Dict):
@@ -46,7 +53,7 @@ class Example:
             for loc, var in d["source"].items()
         }
 
-        if d["target"] is not None:
+        if d.get("target") is not None:
             target = {
                 location_from_json_key(loc): Variable.from_json(var)
                 for loc, var in d["target"].items()
@@ -61,6 +68,7 @@ class Example:
             target,
             test_meta=d.get("test_meta", None),
             binary=d.get("binary", None),
+            read_position=d.get("__position__"),
         )
 
     def to_json(self):
@@ -153,6 +161,104 @@ class Example:
         return self._is_valid
 
 
+class AnnotatedExample:
+    """Compact form of an annotated Example used for training.
+
+    Only the fields needed for batching are kept: ids are int32 NumPy arrays,
+    strings are interned (type names repeat across examples), and the memory
+    layouts of all variables share one flat array. The code tokens, raw code
+    and Variable objects of the original Example are dropped.
+    """
+
+    __slots__ = (
+        "binary",
+        "name",
+        "test_meta",
+        "sub_token_ids",
+        "source_seq_length",
+        "src_var_names",
+        "tgt_var_names",
+        "tgt_var_name_ids",
+        "src_var_types",
+        "src_var_types_str",
+        "tgt_var_types",
+        "tgt_var_types_str",
+        "tgt_var_subtypes",
+        "tgt_var_type_sizes",
+        "mention_positions",
+        "mention_var_ids",
+        "_mems",
+        "_mem_offsets",
+        "read_position",
+    )
+
+    def __init__(
+        self,
+        binary: str,
+        name: str,
+        test_meta: Optional[Dict[str, bool]],
+        sub_token_ids,
+        src_var_names: List[str],
+        tgt_var_names: List[str],
+        src_var_types,
+        src_var_types_str: List[str],
+        tgt_var_types,
+        tgt_var_types_str: List[str],
+        tgt_var_subtypes,
+        tgt_var_type_sizes,
+        tgt_var_src_mems,
+        mention_positions,
+        mention_var_ids,
+        tgt_var_name_ids=None,
+        read_position: Optional[Tuple[int, int]] = None,
+    ):
+        self.binary = binary
+        self.name = name
+        self.test_meta = test_meta
+        self.sub_token_ids = AnnotatedExample._ids(sub_token_ids)
+        self.source_seq_length = len(self.sub_token_ids)
+        self.src_var_names = AnnotatedExample._strs(src_var_names)
+        self.tgt_var_names = AnnotatedExample._strs(tgt_var_names)
+        self.src_var_types = AnnotatedExample._ids(src_var_types)
+        self.src_var_types_str = AnnotatedExample._strs(src_var_types_str)
+        self.tgt_var_types = AnnotatedExample._ids(tgt_var_types)
+        self.tgt_var_types_str = AnnotatedExample._strs(tgt_var_types_str)
+        self.tgt_var_subtypes = AnnotatedExample._ids(tgt_var_subtypes)
+        self.tgt_var_type_sizes = AnnotatedExample._ids(tgt_var_type_sizes)
+        self.mention_positions = AnnotatedExample._ids(mention_positions)
+        self.mention_var_ids = AnnotatedExample._ids(mention_var_ids)
+        self.tgt_var_name_ids = (
+            AnnotatedExample._ids(tgt_var_name_ids)
+            if tgt_var_name_ids is not None
+            else None
+        )
+        mems = [AnnotatedExample._ids(mem) for mem in tgt_var_src_mems]
+        self._mems = np.concatenate(mems) if mems else np.zeros(0, dtype=np.int32)
+        self._mem_offsets = np.cumsum(
+            [0] + [len(mem) for mem in mems], dtype=np.int32
+        )
+        self.read_position = read_position
+
+    @staticmethod
+    def _ids(values) -> np.ndarray:
+        # slices of memory-mapped compiled shards are kept as they are
+        if isinstance(values, np.ndarray) and values.dtype == np.int32:
+            return values
+        return np.asarray(values, dtype=np.int32)
+
+    @staticmethod
+    def _strs(values: List[str]) -> Tuple[str, ...]:
+        return tuple(sys.intern(value) for value in values)
+
+    @property
+    def tgt_var_src_mems(self) -> List[np.ndarray]:
+        """Memory layout of every variable, see Dataset._annotate"""
+        return [
+            self._mems[start:end]
+            for start, end in zip(self._mem_offsets[:-1], self._mem_offsets[1:])
+        ]
+
+
 # HACK: Stupid global lambda functions required for distributed data loading
 def identity(x):
     return x
@@ -162,41 +268,461 @@ def get_src_len(e):
     return e.source_seq_length
 
 
+def get_bucket_key(e):
+    return e.source_seq_length, len(e.src_var_types)
+
+
 class Dataset(wds.Dataset):
 
     SHUFFLE_BUFFER = 5000
+    # final mix on top of the index-driven read order of indexed shards
+    LOCAL_SHUFFLE_BUFFER = 512
     SORT_BUFFER = 512
+    BUCKET_BUFFER = 4096
+    ANNOTATE_BUFFER = 256
+    BPE_THREADS = 4
+    # fields needed without ground truth, e.g., for inference or baselines
+    # that only look at the decompiler output (config["json_fields"])
+    SOURCE_FIELDS = ["name", "code_tokens", "source", "test_meta"]
+
+    def __init__(
+        self,
+        url: str,
+        config: Optional[Dict] = None,
+        percent: float = 1.0,
+        max_tokens: Optional[int] = None,
+        resume_state: Optional[Dict[int, Dict]] = None,
+    ):
+        """max_tokens: if set, yield batches of at most max_tokens padded source
+        tokens instead of single examples (use with DataLoader(batch_size=None))
+
+        resume_state: the reading positions of the DataLoader workers saved in a
+        checkpoint (see Dataset.state), used to continue an interrupted epoch
 
-    def __init__(self, url: str, config: Optional[Dict] = None, percent: float = 1.0):
+        config["obfuscation"]: only read the binaries with these obfuscations
+        (e.g., "none" or ["llvm-obfuscation-fla", "llvm-obfuscation-sub"]), or
+        mix them by example in the given ratios (e.g., {"none": 0.5,
+        "adv-obfuscation": 0.5}), taking a new random subset of the more
+        abundant ones every epoch. Uses the obfuscation recorded in the shard
+        indexes, so the other binaries are never read.
+        """
         # support wildcards
         urls = sorted(glob.glob(url))
-        urls = urls[: int(percent * len(urls))]
-        super().__init__(urls)
+        self.compiled_dir = config.get("compiled_dir") if config else None
+        # the sidecar indexes written by utils/preprocess.py give the exact
+        # number of examples and allow subsampling at example granularity
+        indexes = [ShardIndex.load(url) for url in urls]
+        self.indexes = dict(zip(urls, indexes)) if urls and all(indexes) else None
+        self.obfuscation_ratios = Dataset._obfuscation_ratios(
+            config.get("obfuscation") if config else None
+        )
+        self.mix_obfuscations = config is not None and isinstance(
+            config.get("obfuscation"), dict
+        )
+        if self.obfuscation_ratios is not None:
+            if self.indexes is None or self.compiled_dir:
+                raise ValueError("filtering by obfuscation requires indexed tar shards")
+            if not any(
+                "obfuscation" in member
+                for index in self.indexes.values()
+                for member in index.members
+            ):
+                raise ValueError(
+                    "the shard indexes have no obfuscation, rebuild them with "
+                    "utils/shard_index.py --meta-data"
+                )
+        self.member_limits: Dict[str, int] = {}
+        if self.indexes is not None and not self.compiled_dir:
+            urls, self.member_limits = Dataset._subsample(
+                urls,
+                {url: self._member_lengths(self.indexes[url]) for url in urls},
+                percent,
+            )
+        else:
+            urls = urls[: int(percent * len(urls))]
+        length = None
+        if self.indexes is not None and not max_tokens:
+            if self.mix_obfuscations:
+                length = sum(self._mix_targets(urls).values())
+            else:
+                length = sum(
+                    self.member_limits.get(key, n)
+                    for url in urls
+                    for key, n in self._member_lengths(self.indexes[url])
+                )
+        # the number of lines to read of the members cut to mix obfuscations
+        # in an epoch, by (shard, member)
+        self.epoch_limits: Dict[Tuple[int, int], int] = {}
+        if self.compiled_dir or self.indexes is not None:
+            # compiled and indexed shards are read member by member by
+            # raw_samples, no tar grouping needed
+            super().__init__(urls, length=length, initial_pipeline=[])
+        else:
+            super().__init__(urls, length=length)
+        self.resume_state = resume_state
+        self.position: Optional[Dict] = None
+        # positions read but not yet emitted in a batch, and positions before
+        # self.position still to be read again after resuming
+        self._in_flight: Set[Tuple[int, int]] = set()
+        self._to_replay: Set[Tuple[int, int]] = set()
+        self._track_in_flight = False
+        self.annotate = config is not None
+        self.max_tokens = max_tokens
+        self.decoder = JSONDecoder(
+            config.get("json_backend", "auto") if config else "auto",
+            config.get("json_fields") if config else None,
+        )
+        # no ground truth when the target field is not decoded
+        self.has_target = (
+            self.decoder.fields is None or "target" in self.decoder.fields
+        )
         if config:
             # annotate example for training
-            from utils.vocab import Vocab
+            from utils.registry import load_typelib, load_vocab
 
-            self.vocab = Vocab.load(config["vocab_file"])
-            with open(config["typelib_file"]) as type_f:
-                self.typelib = TypeLibCodec.decode(type_f.read())
+            self.vocab = load_vocab(config["vocab_file"])
+            self.typelib = load_typelib(config["typelib_file"])
             self.max_src_tokens_len = config["max_src_tokens_len"]
             self.max_num_var = config["max_num_var"]
-            annotate = self._annotate
+            annotate = self._annotate_buffer
             self.rename = config.get("rename", False)
+            self.bpe_threads = config.get("bpe_threads", Dataset.BPE_THREADS)
             # sort = Dataset._sort
             sort = identity
+            if max_tokens:
+                sort = self._bucket
         else:
             # for creating the vocab
             annotate = identity
             sort = identity
-        self = (
-            self.pipe(Dataset._file_iter_to_line_iter)
-            .map(Example.from_json)
-            .map(annotate)
-            .shuffle(Dataset.SHUFFLE_BUFFER)
-            .pipe(sort)
+        if self.compiled_dir:
+            from utils.compiled import compile_key
+
+            self.compiled_key = compile_key(config)
+            # opened by each worker, and kept for as long as the worker lives
+            self._compiled_shards: Dict[str, "CompiledShard"] = {}
+            self = self.shuffle(Dataset.LOCAL_SHUFFLE_BUFFER).pipe(sort)
+        else:
+            self = (
+                self.pipe(self._line_iter)
+                .map(Example.from_json)
+                .pipe(annotate)
+                .shuffle(
+                    Dataset.SHUFFLE_BUFFER
+                    if self.indexes is None
+                    else Dataset.LOCAL_SHUFFLE_BUFFER
+                )
+                .pipe(sort)
+            )
+
+    def __len__(self) -> int:
+        """The exact number of examples, available when all shards are indexed"""
+        if self.length is None:
+            raise TypeError("length is unknown: shards are not indexed or batched by tokens")
+        return self.length
+
+    @staticmethod
+    def _obfuscation_ratios(
+        obfuscation: Union[None, str, List[str], Dict[str, float]]
+    ) -> Optional[Dict[str, float]]:
+        """The obfuscations to read and their share of the examples"""
+        if obfuscation is None:
+            return None
+        if isinstance(obfuscation, str):
+            obfuscation = [obfuscation]
+        if not isinstance(obfuscation, dict):
+            obfuscation = {kind: 1.0 for kind in obfuscation}
+        total = sum(obfuscation.values())
+        if total <= 0 or any(ratio < 0 for ratio in obfuscation.values()):
+            raise ValueError(f"invalid obfuscation ratios {obfuscation}")
+        return {
+            kind: ratio / total for kind, ratio in obfuscation.items() if ratio > 0
+        }
+
+    def _compiled_shard(self, url: str) -> "CompiledShard":
+        """The compiled shard of a tar shard, opened once per worker"""
+        if url not in self._compiled_shards:
+            from utils.compiled import CompiledShard, compiled_path
+
+            self._compiled_shards[url] = CompiledShard(
+                compiled_path(self.compiled_dir, self.compiled_key, url),
+                self.compiled_key,
+                url,
+            )
+        return self._compiled_shards[url]
+
+    def _keeps(self, member: Dict) -> bool:
+        """Whether a member of an indexed shard passes the obfuscation filter"""
+        return (
+            self.obfuscation_ratios is None
+            or member.get("obfuscation") in self.obfuscation_ratios
         )
 
+    def _member_lengths(self, index: ShardIndex) -> List[Tuple[str, int]]:
+        """(sample key, number of examples) of the members of an indexed shard"""
+        return [
+            (base_plus_ext(member["name"])[0], len(member["lines"]))
+            for member in index.members
+            if self._keeps(member)
+        ]
+
+    @staticmethod
+    def _subsample(
+        urls: List[str], lengths: Dict[str, List[Tuple[str, int]]], percent: float
+    ) -> Tuple[List[str], Dict[str, int]]:
+        """Keep the first percent of all examples, given the (sample key, number
+        of examples) of the members of each shard. Returns the shards to read
+        and the number of lines to keep for the members that are cut."""
+        if percent >= 1.0:
+            return urls, {}
+        keep = int(percent * sum(n for url in urls for _, n in lengths[url]))
+        kept_urls = []
+        member_limits = {}
+        for url in urls:
+            if keep == 0:
+                break
+            kept_urls.append(url)
+            for key, n in lengths[url]:
+                if keep < n:
+                    member_limits[key] = keep
+                keep -= min(keep, n)
+        return kept_urls, member_limits
+
+    def get(self, binary: str, name: str) -> Optional[Example]:
+        """Random access to a function by binary and name using the shard indexes"""
+        if self.indexes is None:
+            raise ValueError("random access requires indexed shards")
+        if not hasattr(self, "_binary_to_url"):
+            self._binary_to_url = {
+                ShardIndex.binary_of(member["name"]): url
+                for url, index in self.indexes.items()
+                for member in index.members
+            }
+        url = self._binary_to_url.get(binary)
+        line = self.indexes[url].read_line(binary, name) if url else None
+        if line is None:
+            return None
+        json_line = self.decoder(line)
+        json_line["binary"] = binary
+        example = Example.from_json(json_line)
+        if self.annotate:
+            example = self._annotate(example)
+        return example
+
+    def state(self) -> Optional[Dict]:
+        """The reading position of this copy of the dataset, i.e., the shards
+        and the read order seed of the epoch, the number of DataLoader workers
+        they are split across, how far the read order has been consumed, the
+        [step, line] positions read before it whose examples are still
+        buffered, and the shuffle RNG state. None if the shards are not
+        indexed.
+
+        Only made of python lists, ints and strings, so that checkpoints load
+        with torch.load(weights_only=True)."""
+        if self.position is None:
+            return None
+        in_flight = [list(position) for position in sorted(self._in_flight)]
+        return {**self.position, "in_flight": in_flight, "rng": self.rng.getstate()}
+
+    def _emitted(self, examples: List[AnnotatedExample]) -> None:
+        """Examples are emitted once they are collated into a batch"""
+        for example in examples:
+            self._in_flight.discard(example.read_position)
+
+    def _start_position(
+        self, urls: List[str]
+    ) -> Tuple[List[str], int, int, int, Set[Tuple[int, int]]]:
+        """The shards to read, the read order seed, the (step, line) reached
+        and the positions before it to read again, taken from resume_state for
+        the first epoch after resuming"""
+        worker_info = torch.utils.data.get_worker_info()
+        worker_id = worker_info.id if worker_info is not None else 0
+        if not self.resume_state or worker_id not in self.resume_state:
+            return urls, self.rng.randrange(2 ** 32), 0, 0, set()
+        state = self.resume_state.pop(worker_id)
+        # the shards of the other workers would be read by none or by two
+        if state["num_workers"] != self._num_workers():
+            raise ValueError(
+                f"resuming with {self._num_workers()} DataLoader workers, but the "
+                f"reading positions were saved with {state['num_workers']}"
+            )
+        self.rng.setstate(state["rng"])
+        return (
+            state["urls"],
+            state["seed"],
+            state["step"],
+            state["line"],
+            {tuple(position) for position in state["in_flight"]},
+        )
+
+    @staticmethod
+    def _num_workers() -> int:
+        worker_info = torch.utils.data.get_worker_info()
+        return worker_info.num_workers if worker_info is not None else 0
+
+    def _read_order(self, urls: List[str], seed: int) -> List[Tuple[int, int]]:
+        """Order in which (shard, member) pairs are read in an epoch, or
+        (shard, example) pairs for compiled shards.
+
+        Members of indexed shards are permuted across all shards. Compiled
+        shards are permuted, and so are the examples in each of them, which
+        keeps reads local to one memory-mapped shard at a time.
+        """
+        rng = np.random.RandomState(seed)
+        if self.compiled_dir:
+            order = []
+            for shard_id in rng.permutation(len(urls)).tolist():
+                shard = self._compiled_shard(urls[shard_id])
+                order += [(shard_id, idx) for idx in rng.permutation(len(shard)).tolist()]
+            return order
+        order = [
+            (shard_id, member_id)
+            for shard_id, url in enumerate(urls)
+            for member_id, member in enumerate(self.indexes[url].members)
+            if self._keeps(member)
+        ]
+        order = [order[i] for i in rng.permutation(len(order)).tolist()]
+        self.epoch_limits = {}
+        if self.mix_obfuscations:
+            order = self._mix(urls, order)
+        return order
+
+    def _example_counts(self, urls: List[str]) -> Dict[Tuple[int, int], int]:
+        """Number of examples to read of each kept (shard, member)"""
+        counts = {}
+        for shard_id, url in enumerate(urls):
+            for member_id, member in enumerate(self.indexes[url].members):
+                if self._keeps(member):
+                    key = base_plus_ext(member["name"])[0]
+                    counts[shard_id, member_id] = self.member_limits.get(
+                        key, len(member["lines"])
+                    )
+        return counts
+
+    def _mix_targets(self, urls: List[str]) -> Dict[str, int]:
+        """Number of examples of each obfuscation in an epoch: as many as
+        possible in the configured ratios"""
+        available = {kind: 0 for kind in self.obfuscation_ratios}
+        for (shard_id, member_id), n in self._example_counts(urls).items():
+            member = self.indexes[urls[shard_id]].members[member_id]
+            available[member["obfuscation"]] += n
+        total = min(
+            available[kind] / ratio for kind, ratio in self.obfuscation_ratios.items()
+        )
+        return {
+            kind: int(ratio * total) for kind, ratio in self.obfuscation_ratios.items()
+        }
+
+    def _mix(
+        self, urls: List[str], order: List[Tuple[int, int]]
+    ) -> List[Tuple[int, int]]:
+        """Keep the first members of each obfuscation in the read order up to
+        its number of examples in the epoch, cutting the last one"""
+        budgets = self._mix_targets(urls)
+        counts = self._example_counts(urls)
+        mixed = []
+        for shard_id, member_id in order:
+            kind = self.indexes[urls[shard_id]].members[member_id]["obfuscation"]
+            n = min(counts[shard_id, member_id], budgets[kind])
+            if n == 0:
+                continue
+            if n < counts[shard_id, member_id]:
+                self.epoch_limits[shard_id, member_id] = n
+            budgets[kind] -= n
+            mixed.append((shard_id, member_id))
+        return mixed
+
+    def raw_samples(self, urls):
+        if not self.compiled_dir and self.indexes is None:
+            yield from super().raw_samples(urls)
+            return
+        # Shuffling is driven by the indexes: the read order is a seeded
+        # permutation of what the shards hold, so only a small local shuffle
+        # buffer is needed, and the seed and the step reached in the order
+        # are enough to resume reading
+        urls, seed, step, line, self._to_replay = self._start_position(urls)
+        self.position = dict(
+            urls=urls,
+            seed=seed,
+            num_workers=self._num_workers(),
+            step=step,
+            line=line,
+        )
+        # the examples still buffered when resuming are read again
+        first_step, first_line = min(self._to_replay, default=(step, line))
+        self._in_flight = set()
+        # only DataLoader workers emit batches, see collate_fn
+        self._track_in_flight = torch.utils.data.get_worker_info() is not None
+        order = self._read_order(urls, seed)
+        if self.compiled_dir:
+            # Read annotated examples from the memory-mapped arrays written by
+            # utils/compiled.py instead of parsing the tar shards
+            shard = None
+            for step in range(first_step, len(order)):
+                shard_id, idx = order[step]
+                if shard is not self._compiled_shard(urls[shard_id]):
+                    self.shard_hook()
+                    # shards are read one after the other
+                    if shard is not None:
+                        shard.release()
+                    shard = self._compiled_shard(urls[shard_id])
+                if self._is_read((step, 0)):
+                    continue
+                example = shard[idx]
+                example.read_position = step, 0
+                yield example
+            return
+        # Seek to the members of indexed shards instead of streaming the tar
+        files = {}
+        try:
+            for step in range(first_step, len(order)):
+                shard_id, member_id = order[step]
+                url = urls[shard_id]
+                member = self.indexes[url].members[member_id]
+                first = first_line if step == first_step else 0
+                key = base_plus_ext(member["name"])[0]
+                last = self.member_limits.get(key, len(member["lines"]))
+                last = self.epoch_limits.get((shard_id, member_id), last)
+                if first >= last:
+                    continue
+                if url not in files:
+                    files[url] = open(url, "rb")
+                f = files[url]
+                lines = member["lines"] + [member["size"]]
+                f.seek(member["offset"] + lines[first])
+                data = f.read(lines[last] - lines[first])
+                yield {"__key__": key, "jsonl": data, "__position__": (step, first)}
+        finally:
+            for f in files.values():
+                f.close()
+
+    def _is_read(self, position: Tuple[int, int]) -> bool:
+        """Whether the example at position was emitted before resuming,
+        otherwise it is tracked until it is emitted"""
+        step, line = position
+        if position < (self.position["step"], self.position["line"]):
+            if position not in self._to_replay:
+                return True
+            self._to_replay.discard(position)
+        else:
+            self.position.update(step=step, line=line + 1)
+        if self._track_in_flight:
+            self._in_flight.add(position)
+        return False
+
+    def _line_iter(self, jsonl_iter):
+        """Split members into lines, keeping track of the reading position"""
+        for jsonl in jsonl_iter:
+            position = jsonl.get("__position__")
+            for json_line in Dataset._file_iter_to_line_iter([jsonl], self.decoder):
+                if position is not None:
+                    step, line = position
+                    position = step, line + 1
+                    if self._is_read((step, line)):
+                        continue
+                    json_line["__position__"] = step, line
+                yield json_line
+
     @staticmethod
     def _sort(example_iter):
         sort_pool = []
@@ -215,34 +741,106 @@ class Dataset(wds.Dataset):
             sort_pool_new.sort(key=get_src_len)
             yield from sort_pool
 
+    def _bucket(self, example_iter):
+        """Group examples by length and number of variables into batches
+        bounded by max_tokens (tokens x batch size). The examples held in the
+        pool stay in flight until collate_fn emits their batch, so they are
+        read again after resuming (see Dataset.state)."""
+        pool = []
+        for example in example_iter:
+            pool.append(example)
+            if len(pool) == Dataset.BUCKET_BUFFER:
+                yield from self._batches_from_pool(pool)
+                pool = []
+        if pool:
+            yield from self._batches_from_pool(pool)
+
+    def _batches_from_pool(self, pool):
+        pool.sort(key=get_bucket_key)
+        batches = []
+        batch = []
+        for example in pool:
+            # The pool is sorted, so the current example is the longest in the batch
+            if batch and example.source_seq_length * (len(batch) + 1) > self.max_tokens:
+                batches.append(batch)
+                batch = []
+            batch.append(example)
+        if batch:
+            batches.append(batch)
+        # Randomize the bucket order so training does not see a length curriculum
+        self.rng.shuffle(batches)
+        return batches
+
     @staticmethod
-    def _file_iter_to_line_iter(jsonl_iter):
+    def _file_iter_to_line_iter(jsonl_iter, decoder: Optional[JSONDecoder] = None):
+        if decoder is None:
+            decoder = JSONDecoder()
         for jsonl in jsonl_iter:
             lines = jsonl["jsonl"].split(b"\n")
             for line in lines:
                 if not line:
                     continue
-                json_line = json.loads(line)
+                json_line = decoder(line)
                 json_line["binary"] = jsonl["__key__"][: jsonl["__key__"].index("_")]
                 yield json_line
 
-    def _annotate(self, example: Example):
+    def _annotate_buffer(self, example_iter):
+        """Annotate examples in buffers so that BPE encoding runs as one
+        batched (and multi-threaded) SentencePiece call per buffer"""
+        buffer = []
+        for example in example_iter:
+            buffer.append(example)
+            if len(buffer) == Dataset.ANNOTATE_BUFFER:
+                yield from self._annotate_batch(buffer)
+                buffer = []
+        if buffer:
+            yield from self._annotate_batch(buffer)
+
+    def _annotate_batch(self, examples: List[Example]) -> List[Example]:
+        snippets = [" ".join(example.code_tokens) for example in examples]
         src_bpe_model = self.vocab.source_tokens.subtoken_model
-        snippet = example.code_tokens
-        snippet = " ".join(snippet)
-        sub_tokens = (
-            ["<s>"]
-            + src_bpe_model.encode_as_pieces(snippet)[: self.max_src_tokens_len]
-            + ["</s>"]
-        )
+        try:
+            ids_batch = src_bpe_model.encode(
+                snippets, out_type=int, num_threads=self.bpe_threads
+            )
+        except (AttributeError, TypeError):
+            # older sentencepiece releases have no multi-threaded batch encoding
+            ids_batch = [src_bpe_model.encode_as_ids(snippet) for snippet in snippets]
+        return [
+            self._annotate(example, ids) for example, ids in zip(examples, ids_batch)
+        ]
+
+    def _annotate(
+        self, example: Example, ids: Optional[List[int]] = None
+    ) -> AnnotatedExample:
+        """Annotate an example for training. ids are the BPE ids of the code
+        tokens if they have already been encoded."""
+        src_bpe_model = self.vocab.source_tokens.subtoken_model
+        if ids is None:
+            ids = src_bpe_model.encode_as_ids(" ".join(example.code_tokens))
         sub_token_ids = (
             [src_bpe_model.bos_id()]
-            + src_bpe_model.encode_as_ids(snippet)[: self.max_src_tokens_len]
+            + ids[: self.max_src_tokens_len]
             + [src_bpe_model.eos_id()]
         )
-        setattr(example, "sub_tokens", sub_tokens)
-        setattr(example, "sub_token_ids", sub_token_ids)
-        setattr(example, "source_seq_length", len(sub_tokens))
+
+        # Variable names are user-defined symbols of the BPE model, so each
+        # mention is a single piece. Map every variable to its piece id and
+        # build the first position of each piece once.
+        unk_id = src_bpe_model.unk_id()
+        var_piece_ids = {}
+        for loc, var in example.source.items():
+            piece_id = src_bpe_model.piece_to_id(f"@@{var.name}@@")
+            if piece_id != unk_id:
+                var_piece_ids[loc] = piece_id
+        sub_token_ids_array = np.array(sub_token_ids, dtype=np.int64)
+        mention_mask = np.isin(
+            sub_token_ids_array, np.fromiter(var_piece_ids.values(), dtype=np.int64)
+        )
+        mention_positions = np.nonzero(mention_mask)[0]
+        first_position = {}
+        for position in mention_positions.tolist():
+            first_position.setdefault(sub_token_ids[position], position)
 
         types_model = self.vocab.types
         subtypes_model = self.vocab.subtypes
@@ -254,34 +852,35 @@ class Dataset(wds.Dataset):
         tgt_var_types_str = []
         tgt_var_subtypes = []
         tgt_var_type_sizes = []
-        tgt_var_type_objs = []
         tgt_var_src_mems = []
         tgt_names = []
         # variables on registers first, followed by those on stack
         locs = sorted(
             example.source,
-            key=lambda x: sub_tokens.index(f"@@{example.source[x].name}@@")
-            if f"@@{example.source[x].name}@@" in sub_tokens
-            else self.max_src_tokens_len,
+            key=lambda x: first_position.get(
+                var_piece_ids.get(x), self.max_src_tokens_len
+            ),
         )
         stack_pos = [x.offset for x in example.source if isinstance(x, Stack)]
         stack_start_pos = max(stack_pos) if stack_pos else None
         for loc in locs[: self.max_num_var]:
             src_var = example.source[loc]
-            tgt_var = example.target[loc]
+            # without ground truth (e.g., target not decoded at inference time)
+            # the decompiler variable is used as a placeholder
+            tgt_var = example.target[loc] if self.has_target else src_var
             src_var_names.append(f"@@{src_var.name}@@")
             tgt_var_names.append(f"@@{tgt_var.name}@@")
-            src_var_types_id.append(types_model.lookup_decomp(str(src_var.typ)))
+            src_var_types_id.append(types_model.decomp_type_id(src_var.typ))
             src_var_types_str.append(str(src_var.typ))
-            tgt_var_types_id.append(types_model[str(tgt_var.typ)])
+            tgt_var_type_id = types_model.type_id(tgt_var.typ)
+            tgt_var_types_id.append(tgt_var_type_id)
             tgt_var_types_str.append(str(tgt_var.typ))
-            if types_model[str(tgt_var.typ)] == types_model.unk_id:
+            if tgt_var_type_id == types_model.unk_id:
                 subtypes = [subtypes_model.unk_id, subtypes_model["<eot>"]]
             else:
-                subtypes = [subtypes_model[subtyp] for subtyp in tgt_var.typ.tokenize()]
+                subtypes = subtypes_model.subtype_ids(tgt_var.typ)
             tgt_var_type_sizes.append(len(subtypes))
             tgt_var_subtypes += subtypes
-            tgt_var_type_objs.append(tgt_var.typ)
             # Memory
             # 0: absolute location of the variable in the function, e.g.,
             #   for registers: Reg 56
@@ -309,23 +908,42 @@ class Dataset(wds.Dataset):
             )
             tgt_names.append(tgt_var.name)
 
-        setattr(example, "src_var_names", src_var_names)
-        setattr(example, "tgt_var_names", tgt_var_names)
-        if self.rename:
-            setattr(
-                example,
-                "tgt_var_name_ids",
-                [self.vocab.names[n[2:-2]] for n in tgt_var_names],
-            )
-        setattr(example, "src_var_types", src_var_types_id)
-        setattr(example, "src_var_types_str", src_var_types_str)
-        setattr(example, "tgt_var_types", tgt_var_types_id)
-        setattr(example, "tgt_var_types_str", tgt_var_types_str)
-        setattr(example, "tgt_var_subtypes", tgt_var_subtypes)
-        setattr(example, "tgt_var_type_sizes", tgt_var_type_sizes)
-        setattr(example, "tgt_var_src_mems", tgt_var_src_mems)
+        # positions of the sub-tokens that mention a kept variable, and the mentioned variable
+        piece_to_var_id = {
+            var_piece_ids[loc]: i
+            for i, loc in enumerate(locs[: self.max_num_var])
+            if loc in var_piece_ids
+        }
+        mentions = [
+            (position, piece_to_var_id[sub_token_ids[position]])
+            for position in mention_positions.tolist()
+            if sub_token_ids[position] in piece_to_var_id
+        ]
+        mentions = np.array(mentions, dtype=np.int64).reshape(-1, 2)
+        mention_positions = mentions[:, 0]
+        mention_var_ids = mentions[:, 1]
 
-        return example
+        return AnnotatedExample(
+            binary=example.binary,
+            name=example.name,
+            test_meta=example.test_meta,
+            sub_token_ids=sub_token_ids,
+            src_var_names=src_var_names,
+            tgt_var_names=tgt_var_names,
+            src_var_types=src_var_types_id,
+            src_var_types_str=src_var_types_str,
+            tgt_var_types=tgt_var_types_id,
+            tgt_var_types_str=tgt_var_types_str,
+            tgt_var_subtypes=tgt_var_subtypes,
+            tgt_var_type_sizes=tgt_var_type_sizes,
+            tgt_var_src_mems=tgt_var_src_mems,
+            mention_positions=mention_positions,
+            mention_var_ids=mention_var_ids,
+            tgt_var_name_ids=[self.vocab.names[n[2:-2]] for n in tgt_var_names]
+            if self.rename
+            else None,
+            read_position=example.read_position,
+        )
 
     @staticmethod
     def collate_fn(
@@ -333,7 +951,7 @@ class Dataset(wds.Dataset):
     ) -> Tuple[
         Dict[str, Union[torch.Tensor, int]], Dict[str, Union[torch.Tensor, List]]
     ]:
-        token_ids = [torch.tensor(e.sub_token_ids) for e in examples]
+        token_ids = [torch.tensor(e.sub_token_ids, dtype=torch.long) for e in examples]
         input = pad_sequence(token_ids, batch_first=True)
         max_time_step = input.shape[1]
         # corresponding var_id of each token in sub_tokens
@@ -347,14 +965,27 @@ class Dataset(wds.Dataset):
             len(examples), max(len(e.src_var_names) for e in examples)
         )
 
-        for e_id, example in enumerate(examples):
-            var_name_to_id = {name: i for i, name in enumerate(example.src_var_names)}
-            for i, sub_token in enumerate(example.sub_tokens):
-                if sub_token in example.src_var_names:
-                    var_id = var_name_to_id[sub_token]
-                    variable_mention_to_variable_id[e_id, i] = var_id
-                    variable_mention_mask[e_id, i] = 1.0
-                    variable_mention_num[e_id, var_name_to_id[sub_token]] += 1
+        # scatter all mentions of the batch at once
+        mention_example_ids = torch.from_numpy(
+            np.repeat(
+                np.arange(len(examples)), [len(e.mention_positions) for e in examples]
+            )
+        )
+        mention_positions = torch.from_numpy(
+            np.concatenate([e.mention_positions for e in examples]).astype(np.int64)
+        )
+        mention_var_ids = torch.from_numpy(
+            np.concatenate([e.mention_var_ids for e in examples]).astype(np.int64)
+        )
+        variable_mention_to_variable_id[
+            mention_example_ids, mention_positions
+        ] = mention_var_ids
+        variable_mention_mask[mention_example_ids, mention_positions] = 1.0
+        variable_mention_num.index_put_(
+            (mention_example_ids, mention_var_ids),
+            torch.ones(len(mention_var_ids)),
+            accumulate=True,
+        )
         # if mentioned for each var_id
         variable_encoding_mask = (variable_mention_num > 0).float()
 
@@ -388,8 +1019,16 @@ class Dataset(wds.Dataset):
         target_type_src_mems_unflattened[target_mask] = target_type_src_mems
         target_type_src_mems = target_type_src_mems_unflattened
 
+        # reading position of the worker that produced this batch, so that the
+        # model can store it in checkpoints
+        worker_info = torch.utils.data.get_worker_info()
+        dataset_state = None
+        if worker_info is not None and isinstance(worker_info.dataset, Dataset):
+            worker_info.dataset._emitted(examples)
+            dataset_state = (worker_info.id, worker_info.dataset.state())
+
         # renaming task
-        if hasattr(examples[0], "tgt_var_name_ids"):
+        if examples[0].tgt_var_name_ids is not None:
             name_ids = [
                 torch.tensor(e.tgt_var_name_ids, dtype=torch.long) for e in examples
             ]
@@ -399,13 +1038,9 @@ class Dataset(wds.Dataset):
 
         return (
             dict(
-                index=sum(
-                    [
-                        [(e.binary, e.name, name) for name in e.src_var_names]
-                        for e in examples
-                    ],
-                    [],
-                ),
+                index=[
+                    (e.binary, e.name, name) for e in examples for name in e.src_var_names
+                ],
                 src_code_tokens=input,
                 variable_mention_to_variable_id=variable_mention_to_variable_id,
                 variable_mention_mask=variable_mention_mask,
@@ -416,9 +1051,10 @@ class Dataset(wds.Dataset):
                 target_mask=target_mask,
                 target_submask=target_subtype_id > 0,
                 target_type_sizes=target_type_sizes,
+                dataset_state=dataset_state,
             ),
             dict(
-                tgt_var_names=sum([e.tgt_var_names for e in examples], []),
+                tgt_var_names=[name for e in examples for name in e.tgt_var_names],
                 target_type_id=target_type_id,
                 target_name_id=target_name_id,
                 target_subtype_id=target_subtype_id,
@@ -1,6 +1,5 @@
 from contextlib import ContextDecorator
 import glob
-import json
 import sys
 from collections import Counter
 
@@ -9,6 +8,10 @@ import torch
 import webdataset as wds
 from tqdm import tqdm
 
+from utils.json_decoder import JSONDecoder
+
+decoder = JSONDecoder(fields=["name", "code_tokens", "source", "test_meta"])
+
 
 def _file_iter_to_line_iter(jsonl_iter):
     for jsonl in jsonl_iter:
@@ -16,7 +19,7 @@ def _file_iter_to_line_iter(jsonl_iter):
         for line in lines:
             if not line:
                 continue
-            json_line = json.loads(line)
+            json_line = decoder(line)
             json_line["binary"] = jsonl["__key__"]
             yield json_line
 
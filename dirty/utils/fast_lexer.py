@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+"""
+Fast tokenizer for Hex-Rays pseudocode.
+
+Produces the same tokens as tokenize_raw_code with the Pygments-based
+HexRaysLexer in utils/lexer.py, but scans with one compiled master regex per
+lexer state instead of trying the rules of a state one by one, and classifies
+tokens by the rule that matched instead of checking token subtypes.
+
+Only the distinctions that matter for the token stream are kept: whitespace,
+comments, preprocessor lines and "::" are dropped, string pieces are merged
+into one "String" token, numbers become "Number", and every other token is
+its text.
+
+Running this module checks the equivalence with the Pygments path on the
+raw code of the given binaries (tests/test_fast_lexer.py checks it on a
+corpus of edge cases):
+
+Usage:
+    fast_lexer.py BIN_FILE...
+
+Options:
+    -h --help                  Show this screen.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+# Kinds of token
+SKIP = 0  # whitespace, comments, preprocessor lines, "::"
+STRING = 1  # piece of a string or character literal
+NUMBER = 2
+TOKEN = 3  # any other token, kept as its text
+FUNCTION = 4  # function definition or declaration, lexed group by group
+PREPROC = 5  # preprocessor line, a leading comment is lexed on its own
+
+# State transitions
+PUSH = "#push"
+POP = "#pop"
+
+_ws1 = r"\s*(?:/[*].*?[*]/\s*)?"
+
+# Rules in the order of pygments.lexers.c_cpp.CFamilyLexer (pygments 2.6.1)
+# and the additions of HexRaysLexer, as (pattern, kind, new state). Rules that
+# only differ by token type are merged when they produce the same tokens.
+_PREPROC_IF0 = re.compile(r"^(" + _ws1 + r")#if\s+0", re.M)
+_PREPROC = re.compile(r"^(" + _ws1 + r")#", re.M)
+_WHITESPACE = [
+    (_PREPROC_IF0, PREPROC, "if0"),
+    (_PREPROC, PREPROC, "macro"),
+    (
+        r"\n|\s+|\\\n|//(?:\n|[\w\W]*?[^\\]\n)"
+        r"|/(?:\\\n)?[*][\w\W]*?[*](?:\\\n)?/|/(?:\\\n)?[*][\w\W]*",
+        SKIP,
+        None,
+    ),
+]
+_STATEMENTS = [
+    (
+        r"->|\+\+|--|==|!=|>=|<=|&&|\|\||\+=|-=|\*=|/=|%=|&=|\^=|\|=|<<=|>>="
+        r"|<<|>>|\.\.\.|##",
+        TOKEN,
+        None,
+    ),
+    # the :: added by Hex-Rays to reference shadowed globals is dropped
+    (r"::", SKIP, None),
+    (r"@@VAR_[0-9]+@@\w+@@\w+", TOKEN, None),
+    (r'L?"', STRING, "string"),
+    (r"L?'(?:\\.|\\[0-7]{1,3}|\\x[a-fA-F0-9]{1,2}|[^\\\'\n])'", STRING, None),
+    (
+        r"(?:\d+\.\d*|\.\d+|\d+)[eE][+-]?\d+[LlUu]*"
+        r"|(?:\d+\.\d*|\.\d+|\d+[fF])[fF]?"
+        r"|0x[0-9a-fA-F]+[LlUu]*"
+        r"|0[0-7]+[LlUu]*"
+        r"|\d+[LlUu]*",
+        NUMBER,
+        None,
+    ),
+    (r"\*/", TOKEN, None),
+    (r"[~!%^&*+=|?:<>/-]", TOKEN, None),
+    (r"[()\[\],.]", TOKEN, None),
+    # keywords, builtins and labels all yield the identifier as it is
+    (r"[a-zA-Z_]\w*", TOKEN, None),
+]
+
+
+# function definitions and declarations, only tried in the root state
+_FUNCTION = re.compile(
+    r"((?:[\w*\s])+?(?:\s|[*]))([a-zA-Z_]\w*)(\s*\([^;]*?\))([^;{]*)(\{)", re.M
+)
+_DECLARATION = re.compile(
+    r"((?:[\w*\s])+?(?:\s|[*]))([a-zA-Z_]\w*)(\s*\([^;]*?\))([^;]*)(;)", re.M
+)
+_STATES = {
+    "root": _WHITESPACE
+    + [(_FUNCTION, FUNCTION, "function"), (_DECLARATION, FUNCTION, None)],
+    "statement": _WHITESPACE
+    + _STATEMENTS
+    + [(r"[{}]", TOKEN, None), (r";", TOKEN, POP)],
+    "function": _WHITESPACE
+    + _STATEMENTS
+    + [(r";", TOKEN, None), (r"\{", TOKEN, PUSH), (r"\}", TOKEN, POP)],
+    "string": [
+        (r'"', STRING, POP),
+        (
+            r"\\(?:[\\abfnrtv\"']|x[a-fA-F0-9]{2,4}|u[a-fA-F0-9]{4}"
+            r"|U[a-fA-F0-9]{8}|[0-7]{1,3})"
+            r'|[^\\"\n]+|\\\n|\\',
+            STRING,
+            None,
+        ),
+    ],
+    "macro": [
+        (r"include" + _ws1 + r"[^\n]+|[^/\n]+|/[*](?:.|\n)*?[*]/", SKIP, None),
+        (r"//.*?\n", SKIP, POP),
+        (r"/|(?<=\\)\n", SKIP, None),
+        (r"\n", SKIP, POP),
+    ],
+    "if0": [
+        (r"^\s*#if.*?(?<!\\)\n", SKIP, PUSH),
+        (r"^\s*#el(?:se|if).*\n|^\s*#endif.*?(?<!\\)\n", SKIP, POP),
+        (r".*?\n", SKIP, None),
+    ],
+}
+
+
+def _strip_groups(pattern: str) -> str:
+    """Make the capturing groups of a pattern non-capturing"""
+    return re.sub(r"(?<!\\)\((?!\?)", "(?:", pattern)
+
+
+def _compile(rules):
+    """One master regex per state. Rules whose groups are needed are compiled
+    regexes, and are matched again on their own once the master regex picked
+    them. In the master regex the rules have no capturing groups, so lastindex
+    tells which rule matched."""
+    master = re.compile(
+        "|".join(
+            f"({rule if isinstance(rule, str) else _strip_groups(rule.pattern)})"
+            for rule, _, _ in rules
+        ),
+        re.M,
+    )
+    actions = [None] + [
+        (kind, new_state, None if isinstance(rule, str) else rule.match)
+        for rule, kind, new_state in rules
+    ]
+    return master.match, actions
+
+
+_MASTERS = {state: _compile(rules) for state, rules in _STATES.items()}
+
+
+def _scan(text: str, tokens: List[Tuple[int, str]]) -> None:
+    """Append the (kind, text) tokens of text, starting from the root state"""
+    stack = ["root"]
+    match, actions = _MASTERS["root"]
+    pos = 0
+    end = len(text)
+    while pos < end:
+        m = match(text, pos)
+        if m is None:
+            if stack[-1] == "root":
+                # nothing but a statement can start here
+                stack.append("statement")
+                match, actions = _MASTERS["statement"]
+                continue
+            if text[pos] == "\n":
+                # like Pygments, go back to the root state at an unmatched newline
+                tokens.append((SKIP, "\n"))
+                stack = ["root"]
+                match, actions = _MASTERS["root"]
+            else:
+                tokens.append((TOKEN, text[pos]))
+            pos += 1
+            continue
+        kind, new_state, rule_match = actions[m.lastindex]
+        if kind == PREPROC:
+            # like using(this) in Pygments
+            _scan(rule_match(text, pos).group(1), tokens)
+        elif kind == FUNCTION:
+            # the return type, the signature and what follows it are lexed
+            # on their own, like using(this) in Pygments
+            groups = rule_match(text, pos)
+            _scan(groups.group(1), tokens)
+            tokens.append((TOKEN, groups.group(2)))
+            _scan(groups.group(3), tokens)
+            _scan(groups.group(4), tokens)
+            tokens.append((TOKEN, groups.group(5)))
+        else:
+            tokens.append((kind, m.group()))
+        pos = m.end()
+        if new_state is not None:
+            if new_state == POP:
+                if len(stack) > 1:
+                    stack.pop()
+            elif new_state == PUSH:
+                stack.append(stack[-1])
+            else:
+                stack.append(new_state)
+            match, actions = _MASTERS[stack[-1]]
+
+
+def tokenize(raw_code: Optional[str]) -> Optional[List[str]]:
+    """Same as tokenize_raw_code with the Pygments lexer"""
+    if raw_code is None:
+        return None
+    # the preprocessing of pygments.lexer.Lexer.get_tokens
+    if raw_code.startswith("\ufeff"):
+        raw_code = raw_code[1:]
+    raw_code = raw_code.replace("\r\n", "\n").replace("\r", "\n").strip("\n")
+    if not raw_code.endswith("\n"):
+        raw_code += "\n"
+
+    scanned: List[Tuple[int, str]] = []
+    _scan(raw_code, scanned)
+    ret = []
+    in_string = False
+    for kind, token in scanned:
+        if kind == STRING:
+            # pieces of a string are merged into one token
+            in_string = True
+            continue
+        if in_string:
+            ret.append("String")
+            in_string = False
+        if kind == TOKEN:
+            ret.append(token.strip())
+        elif kind == NUMBER:
+            ret.append("Number")
+    return ret
+
+
+if __name__ == "__main__":
+    import gzip
+    import json
+
+    from docopt import docopt
+    from tqdm import tqdm
+
+    from utils.code_processing import tokenize_raw_code
+
+    args = docopt(__doc__)
+    codes = []
+    for bin_file in args["BIN_FILE"]:
+        with gzip.open(bin_file, "rt") as f:
+            for line in f:
+                if line.strip():
+                    function = json.loads(line)
+                    codes += [function["b"]["c"], function["c"]["c"]]
+    mismatches = 0
+    for code in tqdm(codes):
+        expected = tokenize_raw_code(code, tokenizer="pygments")
+        if tokenize(code) != expected:
+            mismatches += 1
+            print(f"MISMATCH on {code!r}")
+    print(f"{len(codes) - mismatches}/{len(codes)} snippets tokenized identically")
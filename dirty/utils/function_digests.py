@@ -0,0 +1,134 @@
+"""
+Fixed-size digests of functions for tracking the overlap between the
+training set and the dev/test sets during preprocessing.
+
+A function is identified by the digest of its name, and its body by the
+digest of its name and canonical code, so memory does not grow with the
+size of the code.
+"""
+
+import hashlib
+import sqlite3
+from typing import Dict, Iterable, Tuple
+
+DIGEST_SIZE = 16  # blake2b-128
+
+
+def digest(data: str) -> bytes:
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+
+
+def function_digests(name: str, canonical_code: str) -> Tuple[bytes, bytes]:
+    """Digests of the name and of the (name, body) pair of a function"""
+    return digest(name), digest(f"{name}\0{canonical_code}")
+
+
+class FunctionDigests:
+    """Digests of the functions of every binary, kept in memory"""
+
+    def __init__(self):
+        self.files: Dict[str, Dict[bytes, bytes]] = dict()
+        self.train_names = set()
+        self.train_bodies = set()
+
+    def add_file(self, file_name: str, digests: Dict[bytes, bytes]) -> None:
+        """Add the {name digest: body digest} of the functions of a binary"""
+        self.files[file_name] = digests
+
+    def file_digests(self, file_name: str) -> Dict[bytes, bytes]:
+        return self.files[file_name]
+
+    def set_train_files(self, file_names: Iterable[str]) -> None:
+        for file_name in file_names:
+            for name, body in self.files[file_name].items():
+                self.train_names.add(name)
+                self.train_bodies.add(body)
+
+    def name_in_train(self, name: bytes) -> bool:
+        return name in self.train_names
+
+    def body_in_train(self, body: bytes) -> bool:
+        return body in self.train_bodies
+
+    def reopen(self) -> "FunctionDigests":
+        """The digests to use in a forked worker process"""
+        return self
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteFunctionDigests(FunctionDigests):
+    """Digests of the functions of every binary, kept in an SQLite file for
+    corpora whose digests do not fit in memory"""
+
+    def __init__(self, path: str, create: bool = True):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        if not create:
+            return
+        self.conn.executescript(
+            """
+            DROP TABLE IF EXISTS functions;
+            DROP TABLE IF EXISTS train_files;
+            DROP TABLE IF EXISTS train_functions;
+            CREATE TABLE functions (file TEXT, name BLOB, body BLOB);
+            CREATE INDEX functions_file ON functions (file);
+            CREATE TABLE train_files (file TEXT PRIMARY KEY);
+            """
+        )
+
+    def add_file(self, file_name: str, digests: Dict[bytes, bytes]) -> None:
+        self.conn.executemany(
+            "INSERT INTO functions VALUES (?, ?, ?)",
+            ((file_name, name, body) for name, body in digests.items()),
+        )
+
+    def file_digests(self, file_name: str) -> Dict[bytes, bytes]:
+        rows = self.conn.execute(
+            "SELECT name, body FROM functions WHERE file = ?", (file_name,)
+        )
+        digests = dict(rows)
+        if not digests:
+            raise KeyError(file_name)
+        return digests
+
+    def set_train_files(self, file_names: Iterable[str]) -> None:
+        self.conn.executemany(
+            "INSERT INTO train_files VALUES (?)", ((name,) for name in file_names)
+        )
+        # membership only needs the functions of the training files
+        self.conn.executescript(
+            """
+            DROP TABLE IF EXISTS train_functions;
+            CREATE TABLE train_functions AS
+                SELECT name, body FROM functions JOIN train_files USING (file);
+            CREATE INDEX train_functions_name ON train_functions (name);
+            CREATE INDEX train_functions_body ON train_functions (body);
+            """
+        )
+        self.conn.commit()
+
+    def name_in_train(self, name: bytes) -> bool:
+        return (
+            self.conn.execute(
+                "SELECT 1 FROM train_functions WHERE name = ? LIMIT 1", (name,)
+            ).fetchone()
+            is not None
+        )
+
+    def body_in_train(self, body: bytes) -> bool:
+        return (
+            self.conn.execute(
+                "SELECT 1 FROM train_functions WHERE body = ? LIMIT 1", (body,)
+            ).fetchone()
+            is not None
+        )
+
+    def reopen(self) -> "SqliteFunctionDigests":
+        # SQLite connections must not be shared with forked processes
+        return SqliteFunctionDigests(self.path, create=False)
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,66 @@
+"""
+Pluggable JSON decoding for dataset records.
+
+JSON parsing is one of the largest CPU costs of reading the dataset, so the
+fastest installed backend is used: orjson, then ujson, then the standard
+library.
+"""
+
+import json
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+# in order of preference for "auto"
+BACKENDS = ["orjson", "ujson", "json"]
+
+
+def _backend_loads(backend: str) -> Callable[[Union[str, bytes]], Any]:
+    if backend == "orjson":
+        import orjson
+
+        return orjson.loads
+    if backend == "ujson":
+        import ujson
+
+        return ujson.loads
+    if backend == "json":
+        return json.loads
+    raise ValueError(f"unknown JSON backend {backend}, expected one of {BACKENDS}")
+
+
+def get_loads(backend: str = "auto") -> Callable[[Union[str, bytes]], Any]:
+    """The loads function of a backend, "auto" picks the fastest installed one"""
+    if backend != "auto":
+        return _backend_loads(backend)
+    for name in BACKENDS:
+        try:
+            return _backend_loads(name)
+        except ImportError:
+            continue
+
+
+class JSONDecoder:
+    """Decodes JSON lines of dataset records.
+
+    fields: if set, only these top-level fields of a record are kept. None of
+    the backends can skip fields while parsing, but dropping them right away
+    saves turning them into Variables and TypeInfos downstream, e.g., the
+    target variables at inference time.
+    """
+
+    def __init__(self, backend: str = "auto", fields: Optional[Iterable[str]] = None):
+        self.backend = backend
+        self.fields = list(fields) if fields is not None else None
+        self._loads = get_loads(backend)
+
+    def __call__(self, line: Union[str, bytes]) -> Dict:
+        record = self._loads(line)
+        if self.fields is None:
+            return record
+        return {field: record[field] for field in self.fields if field in record}
+
+    # the loads functions of some backends cannot be pickled for DataLoader workers
+    def __getstate__(self):
+        return {"backend": self.backend, "fields": self.fields}
+
+    def __setstate__(self, state):
+        self.__init__(state["backend"], state["fields"])
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Build indexed stores of the metadata of binaries.
+
+The metadata file of a dataset is a JSON list with one entry per binary,
+holding its hash_name, repo_owner, repo_name and obfuscation. Loading it
+takes a while for large corpora, so it is converted once into an SQLite
+file next to it, `<metadata file>.sqlite`, indexed by hash, repository and
+obfuscation, and rebuilt whenever the JSON file is newer.
+
+Usage:
+    metadata_store.py META_FILE...
+
+Options:
+    -h --help                  Show this screen.
+"""
+
+import json
+import os
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from utils.json_decoder import get_loads
+
+json_loads = get_loads()
+
+
+class MetadataStore:
+    """Read-only lookups of the metadata of binaries by hash name, repository
+    (owner, name) and obfuscation"""
+
+    SUFFIX = ".sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+
+    @staticmethod
+    def store_path(meta_path: str) -> str:
+        return meta_path + MetadataStore.SUFFIX
+
+    @classmethod
+    def build(cls, meta_path: str) -> "MetadataStore":
+        """Convert a JSON metadata file into its store"""
+        with open(meta_path, "rb") as f:
+            entries = json_loads(f.read())
+        path = cls.store_path(meta_path)
+        # built aside so that a concurrent reader never sees a partial store
+        tmp_path = f"{path}.{os.getpid()}"
+        conn = sqlite3.connect(tmp_path)
+        conn.executescript(
+            """
+            CREATE TABLE binaries (
+                hash_name TEXT PRIMARY KEY,
+                repo_owner TEXT,
+                repo_name TEXT,
+                obfuscation TEXT,
+                entry TEXT
+            );
+            """
+        )
+        # later entries of a hash override earlier ones, like building a dict
+        conn.executemany(
+            "INSERT OR REPLACE INTO binaries VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    str(entry["hash_name"]),
+                    entry.get("repo_owner"),
+                    entry.get("repo_name"),
+                    entry.get("obfuscation"),
+                    json.dumps(entry),
+                )
+                for entry in entries
+            ),
+        )
+        conn.executescript(
+            """
+            CREATE INDEX binaries_repo ON binaries (repo_owner, repo_name);
+            CREATE INDEX binaries_obfuscation ON binaries (obfuscation);
+            """
+        )
+        conn.commit()
+        conn.close()
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    @classmethod
+    def open(cls, meta_path: str) -> "MetadataStore":
+        """The store of a JSON metadata file, built if missing or outdated"""
+        path = cls.store_path(meta_path)
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(
+            meta_path
+        ):
+            print(f"building the metadata store of {meta_path}")
+            return cls.build(meta_path)
+        return cls(path)
+
+    def get(self, hash_name: str) -> Optional[Dict]:
+        """The metadata entry of a binary, None if it is unknown"""
+        row = self.conn.execute(
+            "SELECT entry FROM binaries WHERE hash_name = ?", (hash_name,)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def repo_of(self, hash_name: str) -> Optional[Tuple[str, str]]:
+        """(owner, name) of the repository of a binary"""
+        return self.conn.execute(
+            "SELECT repo_owner, repo_name FROM binaries WHERE hash_name = ?",
+            (hash_name,),
+        ).fetchone()
+
+    def obfuscation_of(self, hash_name: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT obfuscation FROM binaries WHERE hash_name = ?", (hash_name,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def binaries_of_repo(self, repo_owner: str, repo_name: str) -> List[str]:
+        return [
+            hash_name
+            for hash_name, in self.conn.execute(
+                "SELECT hash_name FROM binaries WHERE repo_owner = ? AND repo_name = ?",
+                (repo_owner, repo_name),
+            )
+        ]
+
+    def binaries_of_obfuscation(self, obfuscation: str) -> List[str]:
+        return [
+            hash_name
+            for hash_name, in self.conn.execute(
+                "SELECT hash_name FROM binaries WHERE obfuscation = ?", (obfuscation,)
+            )
+        ]
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    for meta_path in args["META_FILE"]:
+        MetadataStore.build(meta_path).close()
@@ -6,24 +6,33 @@ Usage:
 Options:
     -h --help                  Show this screen.
     --max=<int>                max dataset size [default: 55000]
-    --shard-size=<int>         shard size [default: 5000]
+    --shard-size=<int>         max binaries in a training shard [default: 5000]
+    --shard-examples=<int>     max number of examples in a training shard
+    --shard-bytes=<int>        max size in bytes of a training shard
     --test-file=<file>         test file
     --no-filtering             do not filter files
     --meta-data=<str>          absolute path to the meta data file
+    --tokenizer=<str>          tokenizer of the code, fast or pygments [default: fast]
+    --rebuild                  reprocess every input instead of reusing previous results
+    --digest-db=<file>         SQLite file of the function digests, in memory if unset
 """
 
 import glob
 import gzip
+import hashlib
+import io
 import multiprocessing
 import os
+import pickle
 import random
 import shutil
 import sys
 import tarfile
+import time
 from pathlib import Path
 from json import dumps
 from multiprocessing import Process
-from typing import Tuple
+from typing import List, Optional, Tuple
 
 import numpy as np
 import ujson as json
@@ -33,69 +42,284 @@ from tqdm import tqdm
 from utils.dataset import Example
 from utils.dire_types import TypeInfo, TypeLib, TypeLibCodec
 from utils.function import CollectedFunction
-from utils.code_processing import canonicalize_code
-
-all_functions = dict()  # indexed by binaries
-
-
-def example_generator(json_str_list):
-    examples = []
-    for json_str, meta in json_str_list:
-        try:
-            json_dict = json.loads(json_str)
-        except ValueError:
-            continue
+from utils.code_processing import canonicalize_code, set_tokenizer
+from utils.function_digests import (
+    FunctionDigests,
+    SqliteFunctionDigests,
+    digest,
+    function_digests,
+)
+from utils.json_decoder import JSONDecoder, get_loads
+from utils.metadata_store import MetadataStore
+from utils.shard_index import ShardIndex
+from utils.variable import Variable
+
+json_loads = get_loads()
+
+
+def make_example(json_str, meta):
+    """A valid example with canonical code from a collected function, or None"""
+    try:
+        json_dict = json_loads(json_str)
+    except ValueError:
+        return None
 
-        # print(f"meta {meta}")
-        cf = CollectedFunction.from_json(json_dict)
+    # print(f"meta {meta}")
+    cf = CollectedFunction.from_json(json_dict)
 
-        example = Example.from_cf(
-            cf, binary_file=meta, max_stack_length=1024, max_type_size=1024
-        )
-
-        if example.is_valid_example:
-            canonical_code = canonicalize_code(example.raw_code)
-            example.canonical_code = canonical_code
-            examples.append(example)
+    example = Example.from_cf(
+        cf, binary_file=meta, max_stack_length=1024, max_type_size=1024
+    )
 
-    return examples
+    if example.is_valid_example:
+        canonical_code = canonicalize_code(example.raw_code)
+        example.canonical_code = canonical_code
+        return example
+    return None
 
 
-def json_line_reader(args):
-    fdir, fname = args
-    bin_file_name = os.path.join(fdir, "bins", fname)
-    func_json_list = []
+def json_line_reader(bin_file_name):
+    """Stream the (line number, JSON string) of the functions of a binary"""
     try:
         with gzip.open(bin_file_name, "rt") as bin_file:
             for line_no, line in enumerate(bin_file):
                 json_str = line.strip()
                 if json_str:
-                    func_json_list.append(
-                        (json_str, dict(
-                            file_name=fname[:-3], line_num=line_no))
-                    )
+                    yield line_no, json_str
     except (gzip.BadGzipFile, EOFError):
         print(f"Bad Gzip file {bin_file_name}")
     except Exception:
         print(f"Bad Gzip file {bin_file_name} unknown error")
 
-    return func_json_list
 
+def input_hash(file_name):
+    """Content hash of an input file"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
-def type_dumper(args):
-    tgt_folder, fname = args
+
+def type_counts_of(typelib):
+    """{type: frequency} of a typelib, in the order of its sorted entries"""
+    typelib.sort()
+    counts = dict()
+    for entries in typelib.values():
+        for entry in entries:
+            counts[entry.typeinfo] = entry.frequency
+    return counts
+
+
+def binary_processor(args):
+    """Build the examples of a binary and write them to files/ in the worker,
+    so that only a summary goes back to the parent:
+    (input name, input hash, file name, number of examples,
+    {name digest: body digest}, {type: frequency} of the target variables)
+
+    The summary is cached under cache/ by the hash of the input, and reused
+    if the input has the hash it had in the previous run, given as
+    previous_hash."""
+    fdir, fname, tgt_folder, previous_hash = args
+    bin_file_name = os.path.join(fdir, "bins", fname)
+    json_file_name = fname[:-3].split("/")[-1]
+    json_file_path = os.path.join(tgt_folder, "files", json_file_name)
+    content_hash = input_hash(bin_file_name)
+    cache_file_name = os.path.join(tgt_folder, "cache", content_hash + ".pkl")
+    if content_hash == previous_hash and os.path.exists(cache_file_name):
+        with open(cache_file_name, "rb") as f:
+            num_examples, digests, type_counts = pickle.load(f)
+        if not num_examples or os.path.exists(json_file_path):
+            return (
+                fname,
+                content_hash,
+                json_file_name,
+                num_examples,
+                digests,
+                type_counts,
+            )
+
+    if os.path.exists(json_file_path):
+        os.remove(json_file_path)
+    num_examples = 0
+    digests = dict()
     typelib = TypeLib()
-    with open(fname, "r") as f:
-        for line in f:
-            e = Example.from_json(json.loads(line))
-            for var in e.target.values():
+    out_file = None
+    try:
+        for line_no, json_str in json_line_reader(bin_file_name):
+            example = make_example(
+                json_str, dict(file_name=fname[:-3], line_num=line_no)
+            )
+            if example is None:
+                continue
+            if out_file is None:
+                out_file = open(json_file_path, "w")
+            out_file.write(dumps(example.to_json()) + "\n")
+            name_digest, body_digest = function_digests(
+                example.name, example.canonical_code
+            )
+            digests[name_digest] = body_digest
+            for var in example.target.values():
                 typelib.add(var.typ)
-    typelib.sort()
-    with open(
-        os.path.join(tgt_folder, "types", fname.split("/")[-1]), "w"
-    ) as type_lib_file:
-        encoded = TypeLibCodec.encode(typelib)
-        type_lib_file.write(encoded)
+            num_examples += 1
+    finally:
+        if out_file is not None:
+            out_file.close()
+
+    type_counts = type_counts_of(typelib)
+    # inputs with the same content may be processed at the same time
+    tmp_file_name = f"{cache_file_name}.{os.getpid()}"
+    with open(tmp_file_name, "wb") as f:
+        pickle.dump((num_examples, digests, type_counts), f)
+    os.replace(tmp_file_name, cache_file_name)
+    return fname, content_hash, json_file_name, num_examples, digests, type_counts
+
+
+class ShardWriter:
+    """Streams tar members into shards named after pattern.format(shard id),
+    starting a new shard before a member would take the current one over
+    max_files binaries, max_examples examples or max_bytes bytes. A member
+    is never split, so a shard holds at least one. The index of each shard
+    is written along with it, with the obfuscation of the binaries if their
+    metadata is given."""
+
+    def __init__(
+        self,
+        pattern: str,
+        max_files: Optional[int] = None,
+        max_examples: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        metadata: Optional[MetadataStore] = None,
+    ):
+        self.pattern = pattern
+        self.metadata = metadata
+        self.max_files = max_files
+        self.max_examples = max_examples
+        self.max_bytes = max_bytes
+        self.shard_paths = []
+        self._tar = None
+        self._index = None
+        self._num_examples = 0
+
+    @staticmethod
+    def _member_bytes(data: bytes) -> int:
+        """Size of a member in the tar file: header and padded data"""
+        blocks = -(-len(data) // tarfile.BLOCKSIZE)
+        return (1 + blocks) * tarfile.BLOCKSIZE
+
+    def _is_full(self, data: bytes, functions: List[str]) -> bool:
+        if self._tar is None:
+            return True
+        if not self._index.members:
+            return False
+        if self.max_files is not None and len(self._index.members) >= self.max_files:
+            return True
+        if (
+            self.max_examples is not None
+            and self._num_examples + len(functions) > self.max_examples
+        ):
+            return True
+        # with the two zero blocks that close a tar file, padded to a record
+        size = self._tar.offset + self._member_bytes(data) + 2 * tarfile.BLOCKSIZE
+        size = -(-size // tarfile.RECORDSIZE) * tarfile.RECORDSIZE
+        return self.max_bytes is not None and size > self.max_bytes
+
+    def _next_shard(self) -> None:
+        self._close_shard()
+        path = self.pattern.format(len(self.shard_paths))
+        self.shard_paths.append(path)
+        self._tar = tarfile.open(path, "w")
+        self._index = ShardIndex(path)
+        self._num_examples = 0
+
+    def _close_shard(self) -> None:
+        if self._tar is not None:
+            self._tar.close()
+            self._index.save()
+            self._tar = None
+
+    def write(self, member_name: str, data: bytes, functions: List[str]) -> None:
+        """Add a member, with the function names of its lines"""
+        if self._is_full(data, functions):
+            self._next_shard()
+        tarinfo = tarfile.TarInfo(member_name)
+        tarinfo.size = len(data)
+        tarinfo.mtime = time.time()
+        self._tar.addfile(tarinfo, io.BytesIO(data))
+        # the data ends at the current offset, padded to a block
+        offset_data = self._tar.offset - self._member_bytes(data) + tarfile.BLOCKSIZE
+        obfuscation = (
+            self.metadata.obfuscation_of(ShardIndex.binary_of(member_name))
+            if self.metadata is not None
+            else None
+        )
+        self._index.add_member(member_name, offset_data, data, functions, obfuscation)
+        self._num_examples += len(functions)
+
+    def close(self) -> None:
+        if not self.shard_paths:
+            # always leave a shard behind, even without members
+            self._next_shard()
+        self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def file_reader(file_name):
+    """Read a file of examples: (tar member name, content, function names)"""
+    with open(file_name, "rb") as f:
+        data = f.read()
+    functions = [json_loads(line)["name"] for line in data.splitlines() if line]
+    return file_name.split("/")[-1], data, functions
+
+
+_digests = None  # function digests of the workers annotating dev/test files
+
+
+def _init_test_meta_annotator():
+    global _digests
+    _digests = _digests.reopen()
+
+
+def test_meta_annotator(file_name):
+    """Annotate the examples of a dev/test file with whether their function
+    name and body are in the training set:
+    (tar member name, annotated file content, function names)"""
+    member_name = file_name.split("/")[-1]
+    file_digests = _digests.file_digests(member_name)
+    lines = []
+    functions = []
+    with open(file_name) as f:
+        for line in f:
+            json_dict = json_loads(line.strip())
+            name_digest = digest(json_dict["name"])
+            func_name_in_train = _digests.name_in_train(name_digest)
+            # the body digest covers the name, so a body in train implies
+            # the name is too
+            func_body_in_train = func_name_in_train and _digests.body_in_train(
+                file_digests[name_digest]
+            )
+            json_dict["test_meta"] = dict(
+                function_name_in_train=func_name_in_train,
+                function_body_in_train=func_body_in_train,
+            )
+            lines.append(json.dumps(json_dict).strip() + "\n")
+            functions.append(json_dict["name"])
+    return member_name, "".join(lines).encode("utf-8"), functions
+
+
+def merge_type_counts(runs):
+    """Merge the type counts of consecutive runs of files, keeping the order
+    of the types a serial merge of the sorted typelib of each file has"""
+    counts = dict()
+    for other in runs:
+        for typ, frequency in other.items():
+            counts[typ] = counts.get(typ, 0) + frequency
+    return counts
 
 
 def main(args):
@@ -115,51 +339,97 @@ def main(args):
             if len(input_fnames) >= max_files:
                 break
     shard_size = int(args["--shard-size"])
-
-    if os.path.exists(tgt_folder):
+    shard_examples = args["--shard-examples"]
+    shard_examples = int(shard_examples) if shard_examples else None
+    shard_bytes = args["--shard-bytes"]
+    shard_bytes = int(shard_bytes) if shard_bytes else None
+    # set before the worker pools are forked
+    set_tokenizer(args["--tokenizer"])
+
+    # the inputs processed by a previous run: {input name: entry}
+    manifest_file_name = os.path.join(tgt_folder, "manifest.json")
+    manifest = dict()
+    if os.path.exists(manifest_file_name) and not args["--rebuild"]:
+        with open(manifest_file_name) as f:
+            manifest = json.load(f)
+        print(f"reusing the results of {len(manifest)} inputs of a previous run")
+    elif os.path.exists(tgt_folder):
         op = input(f"{tgt_folder} exists. remove? (y/n) ")
         if op == "y":
             shutil.rmtree(tgt_folder)
 
     os.system(f"mkdir -p {tgt_folder}")
     os.system(f"mkdir -p {tgt_folder}/files")
-    os.system(f"mkdir -p {tgt_folder}/types")
+    os.system(f"mkdir -p {tgt_folder}/cache")
     num_workers = 20
 
     valid_example_count = 0
+    if args["--digest-db"]:
+        all_functions = SqliteFunctionDigests(args["--digest-db"])
+    else:
+        all_functions = FunctionDigests()
 
     print("loading examples")
+    # largest binaries first so that they do not end up as the stragglers
+    input_fnames.sort(
+        key=lambda fname: os.path.getsize(os.path.join(input_folder, "bins", fname)),
+        reverse=True,
+    )
+    previous_hashes = {
+        fname: entry["hash"]
+        for fname, entry in manifest.items()
+        if entry["tokenizer"] == args["--tokenizer"]
+    }
+    new_manifest = dict()
+    type_counts_of_file = dict()
     with multiprocessing.Pool(num_workers) as pool:
-        json_iter = pool.imap(
-            json_line_reader,
-            ((input_folder, fname) for fname in input_fnames),
-            chunksize=64,
+        summaries = pool.imap_unordered(
+            binary_processor,
+            (
+                (input_folder, fname, tgt_folder, previous_hashes.get(fname))
+                for fname in input_fnames
+            ),
         )
-
-        example_iter = pool.imap(example_generator, json_iter, chunksize=64)
-
-        for examples in tqdm(example_iter):
-            if not examples:
+        for (
+            fname,
+            content_hash,
+            json_file_name,
+            num_examples,
+            digests,
+            type_counts,
+        ) in tqdm(summaries, total=len(input_fnames)):
+            new_manifest[fname] = dict(
+                hash=content_hash,
+                tokenizer=args["--tokenizer"],
+                file_name=json_file_name,
+                num_examples=num_examples,
+            )
+            if not num_examples:
                 continue
-            json_file_name = examples[0].binary_file["file_name"].split(
-                "/")[-1]
-
-            with open(os.path.join(tgt_folder, "files/", json_file_name), "w") as f:
-                for example in examples:
-                    f.write(dumps(example.to_json()) + "\n")
-                    all_functions.setdefault(json_file_name, dict())[
-                        example.name
-                    ] = example.canonical_code
-
-            valid_example_count += len(examples)
+            all_functions.add_file(json_file_name, digests)
+            type_counts_of_file[json_file_name] = type_counts
+            valid_example_count += num_examples
+
+    # drop the results of inputs that are gone or changed
+    hashes = {entry["hash"] for entry in new_manifest.values()}
+    for fname, entry in manifest.items():
+        cache_file_name = os.path.join(tgt_folder, "cache", entry["hash"] + ".pkl")
+        if entry["hash"] not in hashes and os.path.exists(cache_file_name):
+            os.remove(cache_file_name)
+        if fname not in new_manifest:
+            json_file_path = os.path.join(tgt_folder, "files", entry["file_name"])
+            if os.path.exists(json_file_path):
+                os.remove(json_file_path)
+    with open(manifest_file_name, "w") as f:
+        json.dump(new_manifest, f)
+    print(f"{len(new_manifest)} inputs, {len(set(new_manifest) - set(manifest))} new")
 
     print("valid examples: ", valid_example_count)
 
-    cur_dir = os.getcwd()
-    all_files = glob.glob(os.path.join(tgt_folder, "files/*.jsonl"))
+    # sorted by name: glob order depends on the filesystem, and the split must
+    # not depend on which files were reused from a previous run
+    all_files = sorted(glob.glob(os.path.join(tgt_folder, "files/*.jsonl")))
     file_prefix = os.path.join(tgt_folder, "files/")
-    sorted(all_files)  # sort all files by names
-    all_files = list(all_files)
     file_num = len(all_files)
     print("Total valid binary file num: ", file_num)
 
@@ -192,19 +462,22 @@ def main(args):
     dev_files = train_files[-dev_file_num:]
     train_files = train_files[:-dev_file_num]
 
-    # Create types from filtered training set
+    # Create types from filtered training set: merge the type counts of runs
+    # of files in parallel, level by level, keeping the order of the runs so
+    # that ties in frequency are sorted as a serial merge would
+    print("building typelib")
+    counts = [type_counts_of_file[fname.split("/")[-1]] for fname in train_files]
+    del type_counts_of_file
     with multiprocessing.Pool(num_workers) as pool:
-        pool.map(
-            type_dumper,
-            ((tgt_folder, fname) for fname in train_files),
-            chunksize=64,
-        )
-    print("reading typelib")
+        while len(counts) > 1:
+            run_size = max(2, -(-len(counts) // (num_workers * 4)))
+            counts = pool.map(
+                merge_type_counts,
+                [counts[i: i + run_size] for i in range(0, len(counts), run_size)],
+            )
     typelib = TypeLib()
-    for fname in tqdm(train_files):
-        fname = os.path.basename(fname)
-        fname = fname[: fname.index(".")] + ".jsonl"
-        typelib.add_json_file(os.path.join(tgt_folder, "types", fname))
+    for typ, frequency in (counts[0] if counts else {}).items():
+        typelib[typ.size].add_n(typ, frequency)
     typelib.prune(5)
     typelib.sort()
 
@@ -213,116 +486,93 @@ def main(args):
         encoded = TypeLibCodec.encode(typelib)
         type_lib_file.write(encoded)
 
-    train_functions = dict()
-    for train_file in train_files:
-        file_name = train_file.split("/")[-1]
-        for func_name, func in all_functions[file_name].items():
-            train_functions.setdefault(func_name, set()).add(func)
+    all_functions.set_train_files(
+        train_file.split("/")[-1] for train_file in train_files
+    )
 
     print(
         f"number training: {len(train_files)}, number dev: {len(dev_files)}, number test: {len(test_files)}"
     )
+    # recorded in the shard indexes for filtering by obfuscation
+    metadata = (
+        MetadataStore.open(args["--meta-data"]) if args["--meta-data"] else None
+    )
     print("dump training files")
-    shards = [
-        train_files[i: i + shard_size] for i in range(0, len(train_files), shard_size)
-    ]
-    for shard_id, shard_files in enumerate(shards):
-        print(f"Preparing shard {shard_id}, {len(shard_files)} files: ")
-        with open(os.path.join(tgt_folder, "file_list.txt"), "w") as f:
-            for file_name in shard_files:
-                f.write(file_name.split("/")[-1] + "\n")
-
-        os.chdir(os.path.join(tgt_folder, "files"))
-        print("creating tar file...")
-        os.system(f"tar cf ../train-shard-{shard_id}.tar -T ../file_list.txt")
-        os.chdir(cur_dir)
+    # the shards of a previous run
+    for shard_file_name in glob.glob(os.path.join(tgt_folder, "train-shard-*.tar*")):
+        os.remove(shard_file_name)
+    with ShardWriter(
+        os.path.join(tgt_folder, "train-shard-{}.tar"),
+        max_files=shard_size,
+        max_examples=shard_examples,
+        max_bytes=shard_bytes,
+        metadata=metadata,
+    ) as writer, multiprocessing.Pool(num_workers) as pool:
+        for member in tqdm(
+            pool.imap(file_reader, train_files), total=len(train_files)
+        ):
+            writer.write(*member)
+    print(f"{len(writer.shard_paths)} training shards")
 
     def _dump_dev_file(tgt_file_name, file_names):
-        with open(os.path.join(tgt_folder, "file_list.txt"), "w") as f:
-            for file_name in file_names:
-                last_file_name = file_name.split("/")[-1]
-                f.write(last_file_name + "\n")
-
-                with open(file_name) as fr:
-                    all_lines = fr.readlines()
-
-                replace_lines = []
-                for line in all_lines:
-                    json_dict = json.loads(line.strip())
-                    func_name = json_dict["name"]
-                    canonical_code = all_functions[last_file_name][func_name]
-                    func_name_in_train = False
-                    func_body_in_train = False
-                    if func_name in train_functions:
-                        func_name_in_train = True
-                        if canonical_code in train_functions[func_name]:
-                            func_body_in_train = True
-
-                    json_dict["test_meta"] = dict(
-                        function_name_in_train=func_name_in_train,
-                        function_body_in_train=func_body_in_train,
-                    )
-                    new_json_str = json.dumps(json_dict)
-                    replace_lines.append(new_json_str.strip())
-
-                with open(file_name, "w") as fw:
-                    for line in replace_lines:
-                        fw.write(line + "\n")
-
-        os.chdir(os.path.join(tgt_folder, "files"))
-        print("creating tar file...")
-        os.system(f"tar cf ../{tgt_file_name} -T ../file_list.txt")
-        os.chdir(cur_dir)
+        global _digests
+        # inherited by the forked workers
+        _digests = all_functions
+        with ShardWriter(
+            os.path.join(tgt_folder, tgt_file_name), metadata=metadata
+        ) as writer, multiprocessing.Pool(
+            num_workers, initializer=_init_test_meta_annotator
+        ) as pool:
+            for member in tqdm(
+                pool.imap(test_meta_annotator, file_names), total=len(file_names)
+            ):
+                writer.write(*member)
+        _digests = None
 
     print("dump dev files")
     _dump_dev_file("dev.tar", dev_files)
     print("dump test files")
     _dump_dev_file("test.tar", test_files)
+    all_functions.close()
+    if metadata is not None:
+        metadata.close()
 
 
 def test_set_split_by_repo(args, all_files, file_num):
-    # create two dictionaries with unique key of repo_owner/repo_name
-    # randomly sample repos, add all their binaries and return test_set with ~10% split
+    # group the binaries by repo_owner/repo_name, then take the binaries of
+    # randomly ordered repos until there are at least file_num of them
     # param: all_files is List[] of all binary files
     # param: file_num is the number of files to put in test set
     print("Entered test_set_split().")
 
-    with open(args["--meta-data"], "r") as fp:
-        content = json.load(fp)
-
-    meta_data = {d['hash_name']: d for d in content}
-    print("Meta-data file created.")
+    meta_data = MetadataStore.open(args["--meta-data"])
+    print("Meta-data store opened.")
 
-    binaries_num = {}
     binaries_list = {}
     for file in tqdm(all_files):
         hash_name = Path(file).stem.split("_")[0]
-        entry = meta_data[str(hash_name)]
+        repo = meta_data.repo_of(str(hash_name))
 
         # in case we don't find the hash_name
-        if entry is None:
+        if repo is None:
             print(f"{hash_name} not found in {args['--meta-data']} file.")
             continue
 
-        repo_key = f"{entry['repo_owner']}/{entry['repo_name']}"
-        if repo_key in binaries_list:
-            binaries_list[repo_key].append(file)
-            binaries_num[repo_key] += 1
-        else:
-            binaries_list[repo_key] = [file]
-            binaries_num[repo_key] = 1
+        repo_key = "/".join(repo)
+        binaries_list.setdefault(repo_key, []).append(file)
+    meta_data.close()
 
     print("Created binary dictionaries, processed by repository.")
 
-    # now randomly sample from the repo keys (without replacements)
+    # the shortest prefix of a random permutation of the repos with at
+    # least file_num binaries
     repos = list(binaries_list.keys())
-    chosen = 0
+    order = np.random.permutation(len(repos))
+    chosen = np.cumsum([len(binaries_list[repos[i]]) for i in order])
+    num_repos = int(np.searchsorted(chosen, file_num)) + 1 if file_num > 0 else 0
     test_files = []
-    while chosen < file_num:
-        random_repo = np.random.choice(repos)
-        test_files += binaries_list[random_repo]
-        chosen += binaries_num[random_repo]
-        repos.remove(random_repo)
+    for i in order[:num_repos]:
+        test_files += binaries_list[repos[i]]
     print("Chose random repositories to include in data set.")
 
     return test_files
@@ -0,0 +1,96 @@
+"""
+Process-wide registry of vocabularies and typelibs.
+
+Vocab and TypeLib files are needed by the dataset and by several model
+modules. They are loaded once per process, keyed by their path and
+modification time, so a file replaced on disk is loaded again. Objects
+loaded before DataLoader workers are forked are shared with them
+copy-on-write.
+
+Decoding the JSON files is slow, so the loaded objects are also cached as
+pickles in the directory given by the DIRTY_CACHE_DIR environment variable
+(by default ~/.cache/dirty, an empty value disables the cache). A pickle is
+used as long as the file it was made from has not changed.
+"""
+
+import hashlib
+import os
+import pickle
+from typing import Any, Callable, Dict, Tuple
+
+from utils.dire_types import TypeLib, TypeLibCodec
+
+# bumped when the pickled classes change
+CACHE_VERSION = 2
+
+_registry: Dict[Tuple[str, int, str], Any] = {}
+
+
+def _cache_dir() -> str:
+    default = os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "dirty"
+    )
+    return os.environ.get("DIRTY_CACHE_DIR", default)
+
+
+def _file_key(path: str) -> Tuple[str, int, int]:
+    stat = os.stat(path)
+    return os.path.realpath(path), stat.st_mtime_ns, stat.st_size
+
+
+def _cached_load(path: str, load: Callable[[str], Any]) -> Any:
+    """load(path), or the pickle cached for the current content of path"""
+    cache_dir = _cache_dir()
+    if not cache_dir:
+        return load(path)
+    real_path, mtime, size = _file_key(path)
+    # files of the same name in different folders have their own pickle
+    digest = hashlib.sha1(real_path.encode()).hexdigest()[:16]
+    cache_path = os.path.join(cache_dir, f"{os.path.basename(real_path)}.{digest}.pkl")
+    source = (CACHE_VERSION, mtime, size)
+    try:
+        with open(cache_path, "rb") as f:
+            cached_source, obj = pickle.load(f)
+        if cached_source == source:
+            return obj
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        pass
+    obj = load(path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((source, obj), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # e.g., a read-only cache directory, the cache is only an optimization
+        pass
+    return obj
+
+
+def _registered(path: str, kind: str, load: Callable[[], Any]) -> Any:
+    real_path, mtime, _ = _file_key(path)
+    key = (real_path, mtime, kind)
+    if key not in _registry:
+        _registry[key] = load()
+    return _registry[key]
+
+
+def _read_typelib(path: str) -> TypeLib:
+    with open(path) as type_f:
+        return TypeLibCodec.decode(type_f.read())
+
+
+def load_vocab(path: str) -> "Vocab":
+    """The Vocab saved at path, shared by the whole process"""
+    from utils.vocab import Vocab
+
+    return _registered(path, "vocab", lambda: _cached_load(path, Vocab.load))
+
+
+def load_typelib(path: str, fixed: bool = False) -> TypeLib:
+    """The TypeLib saved at path, shared by the whole process. fixed: the
+    result of TypeLib.fix"""
+    if fixed:
+        return _registered(path, "fixed typelib", lambda: load_typelib(path).fix())
+    return _registered(path, "typelib", lambda: _cached_load(path, _read_typelib))
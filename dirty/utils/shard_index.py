@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+Build sidecar indexes for webdataset tar shards.
+
+Usage:
+    shard_index.py [options] TAR_FILE...
+
+Options:
+    -h --help                  Show this screen.
+    --meta-data=<str>          metadata file of the binaries, to record their obfuscation
+"""
+
+import json
+import os
+import tarfile
+from typing import Dict, List, Optional, Tuple
+
+from utils.json_decoder import get_loads
+
+json_loads = get_loads()
+
+
+class ShardIndex:
+    """Sidecar index of a tar shard, stored next to it as `<shard>.tar.idx`.
+
+    For every .jsonl member it holds the byte offset and size of the member
+    data in the tar file, the offsets of the lines (one example per line)
+    inside the member, and the function name of each line. If the metadata
+    of the binaries was given, it also holds the obfuscation of the binary,
+    which lets Dataset filter members without reading them.
+    """
+
+    SUFFIX = ".idx"
+
+    def __init__(self, tar_path: str, members: Optional[List[Dict]] = None):
+        self.tar_path = tar_path
+        self.members: List[Dict] = members if members is not None else []
+        self._locations: Optional[Dict[Tuple[str, str], Tuple[int, int]]] = None
+
+    @staticmethod
+    def index_path(tar_path: str) -> str:
+        return tar_path + ShardIndex.SUFFIX
+
+    @staticmethod
+    def binary_of(member_name: str) -> str:
+        """The binary hash a member belongs to, same as Dataset uses"""
+        return os.path.basename(member_name).split("_")[0]
+
+    def add_member(
+        self,
+        name: str,
+        offset: int,
+        data: bytes,
+        functions: Optional[List[str]] = None,
+        obfuscation: Optional[str] = None,
+    ) -> None:
+        """Index a member whose data starts at byte offset in the tar file.
+        functions: the function names of the lines if already known, to
+        save parsing them again
+        obfuscation: the obfuscation of the binary, if known"""
+        lines = []
+        names = []
+        start = 0
+        for line in data.split(b"\n"):
+            if line:
+                lines.append(start)
+                if functions is None:
+                    names.append(json_loads(line)["name"])
+            start += len(line) + 1
+        if functions is None:
+            functions = names
+        member = dict(
+            name=name,
+            offset=offset,
+            size=len(data),
+            lines=lines,
+            functions=functions,
+        )
+        if obfuscation is not None:
+            member["obfuscation"] = obfuscation
+        self.members.append(member)
+        self._locations = None
+
+    @classmethod
+    def build(cls, tar_path: str, metadata=None) -> "ShardIndex":
+        """Index an existing tar shard. metadata: the MetadataStore of the
+        binaries, to record their obfuscation"""
+        index = cls(tar_path)
+        with tarfile.open(tar_path, "r") as tar:
+            for tarinfo in tar:
+                if not tarinfo.isreg() or not tarinfo.name.endswith(".jsonl"):
+                    continue
+                data = tar.extractfile(tarinfo).read()
+                obfuscation = (
+                    metadata.obfuscation_of(cls.binary_of(tarinfo.name))
+                    if metadata is not None
+                    else None
+                )
+                index.add_member(
+                    tarinfo.name, tarinfo.offset_data, data, obfuscation=obfuscation
+                )
+        return index
+
+    @classmethod
+    def load(cls, tar_path: str) -> Optional["ShardIndex"]:
+        """Load the index of a shard, None if it has not been indexed"""
+        index_path = cls.index_path(tar_path)
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, "r") as f:
+            return cls(tar_path, json.load(f)["members"])
+
+    def save(self) -> None:
+        with open(self.index_path(self.tar_path), "w") as f:
+            json.dump({"members": self.members}, f, separators=(",", ":"))
+
+    @property
+    def num_examples(self) -> int:
+        return sum(len(member["lines"]) for member in self.members)
+
+    def member_lengths(self) -> List[Tuple[str, int]]:
+        """(member name, number of examples) for every member, in tar order"""
+        return [(member["name"], len(member["lines"])) for member in self.members]
+
+    def locate(self, binary: str, name: str) -> Optional[Tuple[int, int]]:
+        """Byte offset and length of the line of a function in the tar file"""
+        if self._locations is None:
+            self._locations = {}
+            for member in self.members:
+                binary_of_member = self.binary_of(member["name"])
+                ends = member["lines"][1:] + [member["size"]]
+                for function, start, end in zip(
+                    member["functions"], member["lines"], ends
+                ):
+                    self._locations[binary_of_member, function] = (
+                        member["offset"] + start,
+                        end - start,
+                    )
+        return self._locations.get((binary, name))
+
+    def read_line(self, binary: str, name: str) -> Optional[bytes]:
+        """Read the JSON line of a function without scanning the tar"""
+        location = self.locate(binary, name)
+        if location is None:
+            return None
+        offset, length = location
+        with open(self.tar_path, "rb") as f:
+            f.seek(offset)
+            return f.read(length).rstrip(b"\n")
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+    from tqdm import tqdm
+
+    from utils.metadata_store import MetadataStore
+
+    args = docopt(__doc__)
+    metadata = (
+        MetadataStore.open(args["--meta-data"]) if args["--meta-data"] else None
+    )
+    for tar_path in tqdm(args["TAR_FILE"]):
+        ShardIndex.build(tar_path, metadata).save()
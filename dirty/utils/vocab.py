@@ -8,8 +8,14 @@ Options:
     --use-bpe                  Use bpe
     --size=<int>               vocab size [default: 10000]
     --freq-cutoff=<int>        frequency cutoff [default: 5]
+    --workers=<int>            number of shards processed in parallel [default: 16]
 """
 
+import glob
+import multiprocessing
+import os
+import shutil
+import tarfile
 from collections import Counter
 from itertools import chain
 
@@ -21,7 +27,8 @@ import sentencepiece as spm
 from tqdm import tqdm
 
 from utils.dire_types import TypeLibCodec
-from utils.variable import Register
+from utils.json_decoder import JSONDecoder
+from utils.variable import Register, location_from_json_key
 
 
 SAME_VARIABLE_TOKEN = "<IDENTITY>"
@@ -54,6 +61,28 @@ class VocabEntry:
             self.word2id[SAME_VARIABLE_TOKEN] = 4
 
         self.id2word = {v: k for k, v in self.word2id.items()}
+        self._clear_type_ids()
+
+    def _clear_type_ids(self):
+        # ids by type, see type_id
+        self._type_ids = {}
+        self._decomp_type_ids = {}
+        self._subtype_ids = {}
+
+    # the SentencePiece model is loaded again from its file when unpickled
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for key in ["subtoken_model", "_type_ids", "_decomp_type_ids", "_subtype_ids"]:
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._clear_type_ids()
+        self.subtoken_model = None
+        if self.subtoken_model_path:
+            self.subtoken_model = spm.SentencePieceProcessor()
+            self.subtoken_model.load(self.subtoken_model_path)
 
     def __getitem__(self, word):
         return self.word2id.get(word, self.unk_id)
@@ -182,6 +211,35 @@ class VocabEntry:
             return self[type_str[7:]]
         return self[type_str]
 
+    # The ids of a type are cached by type, types are shared across examples
+    # so each is looked up once per vocabulary
+
+    def type_id(self, typ):
+        """self[str(typ)]"""
+        try:
+            return self._type_ids[typ]
+        except KeyError:
+            value = self._type_ids[typ] = self[str(typ)]
+            return value
+
+    def decomp_type_id(self, typ):
+        """self.lookup_decomp(str(typ))"""
+        try:
+            return self._decomp_type_ids[typ]
+        except KeyError:
+            value = self._decomp_type_ids[typ] = self.lookup_decomp(str(typ))
+            return value
+
+    def subtype_ids(self, typ):
+        """The ids of the tokens of typ"""
+        try:
+            return self._subtype_ids[typ]
+        except KeyError:
+            value = self._subtype_ids[typ] = tuple(
+                self[subtype] for subtype in typ.tokenize()
+            )
+            return value
+
 
 class Vocab(object):
     def __init__(self, **kwargs):
@@ -222,14 +280,48 @@ class Vocab(object):
         return cls(**entries)
 
 
-if __name__ == "__main__":
-    from utils.dataset import Dataset
+def shard_counter(args):
+    """Count the target variable names and registers of the examples of a
+    training shard, collect their preserved (variable) tokens, and write
+    their code tokens to src_code_tokens_file, one example per line"""
+    shard, src_code_tokens_file = args
+    # the source variables are not needed
+    decoder = JSONDecoder(fields=["code_tokens", "target"])
+    preserved_tokens = set()
+    name_counter = Counter()
+    reg_counter = Counter()
+    with tarfile.open(shard, "r|") as tar, open(
+        src_code_tokens_file, "w"
+    ) as f_src_token:
+        for member in tar:
+            if not member.isreg() or not member.name.endswith(".jsonl"):
+                continue
+            for line in tar.extractfile(member).read().split(b"\n"):
+                if not line:
+                    continue
+                example = decoder(line)
+                code_tokens = example["code_tokens"]
+                target = example.get("target") or {}
+                reg_counter.update(
+                    location.name
+                    for location in map(location_from_json_key, target.keys())
+                    if isinstance(location, Register)
+                )
+                name_counter.update(var["n"] for var in target.values())
+                for token in code_tokens:
+                    if token.startswith("@@") and token.endswith("@@"):
+                        preserved_tokens.add(token)
+                f_src_token.write(" ".join(code_tokens) + "\n")
+    return name_counter, reg_counter, preserved_tokens
+
 
+if __name__ == "__main__":
     args = docopt(__doc__)
     vocab_size = int(args["--size"])
     vocab_file = args["VOCAB_FILE"]
     type_file = args["TYPE_FILE"]
-    train_set = Dataset(args["TRAIN_FILE"])
+    # support wildcards
+    train_shards = sorted(glob.glob(args["TRAIN_FILE"]))
 
     with open(type_file) as type_f:
         typelib = TypeLibCodec.decode(type_f.read())
@@ -254,25 +346,27 @@ if __name__ == "__main__":
         freq_cutoff=int(args["--freq-cutoff"]),
     )
 
+    # count and write the code tokens of the shards in parallel, then merge
     src_code_tokens_file = vocab_file + ".src_code_tokens.txt"
+    part_files = [
+        f"{src_code_tokens_file}.part{i}" for i in range(len(train_shards))
+    ]
     preserved_tokens = set()
     name_counter = Counter()
     reg_counter = Counter()
-    with open(src_code_tokens_file, "w") as f_src_token:
-        tgt_words = []
-        for example in tqdm(train_set):
-            code_tokens = example.code_tokens
-            reg_counter.update(
-                map(
-                    lambda x: x.name,
-                    filter(lambda x: isinstance(x, Register), example.target.keys()),
-                )
-            )
-            name_counter.update(map(lambda x: x.name, example.target.values()))
-            for token in code_tokens:
-                if token.startswith("@@") and token.endswith("@@"):
-                    preserved_tokens.add(token)
-            f_src_token.write(" ".join(code_tokens) + "\n")
+    with multiprocessing.Pool(int(args["--workers"])) as pool:
+        for shard_names, shard_regs, shard_preserved_tokens in tqdm(
+            pool.imap(shard_counter, zip(train_shards, part_files)),
+            total=len(train_shards),
+        ):
+            name_counter.update(shard_names)
+            reg_counter.update(shard_regs)
+            preserved_tokens |= shard_preserved_tokens
+    with open(src_code_tokens_file, "wb") as f_src_token:
+        for part_file in part_files:
+            with open(part_file, "rb") as f_part:
+                shutil.copyfileobj(f_part, f_src_token)
+            os.remove(part_file)
     name_vocab_entry = VocabEntry.from_counter(
         name_counter, size=len(name_counter), freq_cutoff=int(args["--freq-cutoff"])
     )
@@ -285,7 +379,8 @@ if __name__ == "__main__":
 
     print("building source code tokens vocabulary")
     # train subtoken models
-    preserved_tokens = ",".join(preserved_tokens)
+    # sorted so that the ids of the preserved tokens do not depend on the run
+    preserved_tokens = ",".join(sorted(preserved_tokens))
     spm.SentencePieceTrainer.Train(
         f"--add_dummy_prefix=false --pad_id={PAD_ID} --bos_id=1 --eos_id=2 --unk_id=3 "
         f"--user_defined_symbols={preserved_tokens} "